@@ -0,0 +1,144 @@
+"""多店对比批量评分命令行工具
+
+按块流式读取多店对比格式的数据文件 (CSV/Parquet/Arrow)，使用与侧边栏相同的权重评分，逐块写出评分结果，
+并在有限内存内维护全局前K名。
+
+用法示例:
+    python batch_score.py 全国选址库.csv -o 评分结果.csv --top-output 前100名.csv --top-k 100
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import parallel
+import schema
+import scoring
+import validation
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="门店选址批量评分 (流式处理大文件)")
+    parser.add_argument("input", help="多店对比格式的数据文件 (CSV/Excel/Parquet/Arrow)")
+    parser.add_argument("--sheet", help="Excel 文件中要评分的工作表名称 (默认第一个工作表)")
+    parser.add_argument("-o", "--output", help="逐块写出的全部评分结果 (保持输入顺序)")
+    parser.add_argument("--top-output", help="全局前K名排名结果，缺省时输出到标准输出")
+    parser.add_argument("--top-k", type=int, default=100, help="保留的前K名数量 (默认100)")
+    parser.add_argument("--chunksize", type=int, default=200_000, help="每块读取的行数 (默认200000)")
+    parser.add_argument("--weights", type=float, nargs=6, default=list(scoring.DEFAULT_WEIGHTS),
+                        metavar=("人流量", "租金成本", "竞争情况", "周边配套", "交通便利性", "客群匹配度"),
+                        help="六个维度的权重，会自动归一化 (默认与侧边栏一致)")
+    parser.add_argument("--quarantine-output", help="未通过校验的行 (附原始行号和问题说明)，缺省时只统计数量")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="并行评分的进程数，大于1时按分片多进程评分 (默认1)")
+    parser.add_argument("--encoding", default="utf-8-sig", help="输入输出文件编码 (默认utf-8-sig)")
+    return parser.parse_args(argv)
+
+
+class TopK:
+    """流式维护综合评分前K名，内存占用只与K相关"""
+
+    def __init__(self, k):
+        self.k = k
+        self.names = np.empty(0, dtype=object)
+        self.rows = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, len(scoring.SCORE_COLUMNS)), dtype=np.float64)
+        self.overall = np.empty(0, dtype=np.float64)
+
+    def update(self, names, rows, matrix, overall, index=None):
+        # 先在当前块内取前K名，再与已有结果合并
+        if index is None:
+            index = scoring.rank_top_k(overall, self.k)
+        names = np.concatenate([self.names, np.asarray(names, dtype=object)[index]])
+        rows = np.concatenate([self.rows, rows[index]])
+        matrix = np.concatenate([self.matrix, matrix[index]])
+        overall = np.concatenate([self.overall, overall[index]])
+        keep = scoring.rank_top_k(overall, self.k)
+        self.names, self.rows = names[keep], rows[keep]
+        self.matrix, self.overall = matrix[keep], overall[keep]
+
+    def to_frame(self):
+        top_df = scoring.scores_frame(self.names, self.matrix, self.overall, np.arange(len(self.overall)))
+        top_df.insert(0, "排名", np.arange(1, len(top_df) + 1))
+        top_df.insert(2, "原始行号", self.rows + 1)
+        return top_df
+
+
+def _score_chunk(chunk, args, scorer):
+    if scorer is not None:
+        return scorer.score(chunk, args.weights, args.top_k)
+    matrix = scoring.compute_dimension_scores(chunk)
+    overall = scoring.weighted_scores(matrix, args.weights)
+    strengths, weaknesses = scoring.classify_strengths(matrix)
+    return matrix, overall, strengths, weaknesses, None
+
+
+def score_file(args, log=sys.stderr):
+    columns = scoring.REQUIRED_COLUMNS + list(scoring.OPTIONAL_COLUMNS)
+    reader = schema.iter_table_chunks(args.input, args.input, schema.COMPARISON_SCHEMA, columns,
+                                      args.chunksize, args.encoding, args.sheet)
+    scorer = parallel.ShardedScorer(args.workers) if args.workers > 1 else None
+    top = TopK(args.top_k)
+    total_rows = read_rows = quarantined = 0
+    start = time.perf_counter()
+
+    try:
+        for chunk in reader:
+            missing_columns = [col for col in scoring.REQUIRED_COLUMNS if col not in chunk.columns]
+            if missing_columns:
+                raise ValueError(f"数据缺少必要的列: {', '.join(missing_columns)}")
+
+            # 问题行隔离，其余行照常评分
+            validated = validation.validate(chunk.reset_index(drop=True), validation.COMPARISON_RULES,
+                                            data_schema=schema.COMPARISON_SCHEMA)
+            if len(validated.quarantine) and args.quarantine_output:
+                quarantine = validated.quarantine.assign(原始行号=validated.quarantine["原始行号"] + read_rows)
+                quarantine.to_csv(args.quarantine_output, mode="w" if quarantined == 0 else "a",
+                                  header=quarantined == 0, index=False, encoding=args.encoding)
+            quarantined += len(validated.quarantine)
+            rows = read_rows + validated.clean.index.to_numpy()
+            read_rows += len(chunk)
+            chunk = validated.clean
+
+            matrix, overall, strengths, weaknesses, index = _score_chunk(chunk, args, scorer)
+            top.update(chunk["位置名称"].to_numpy(), rows, matrix, overall, index)
+
+            # 逐块追加写出评分结果
+            if args.output:
+                scores_df = scoring.scores_frame(chunk["位置名称"].to_numpy(), matrix, overall,
+                                                 np.arange(len(chunk)))
+                scores_df["优势"] = scoring.describe_codes(strengths, scoring.STRENGTH_LABELS)
+                scores_df["劣势"] = scoring.describe_codes(weaknesses, scoring.WEAKNESS_LABELS)
+                scores_df.to_csv(args.output, mode="w" if total_rows == 0 else "a",
+                                 header=total_rows == 0, index=False, encoding=args.encoding)
+
+            total_rows += len(chunk)
+            print(f"已评分 {total_rows:,} 行，隔离 {quarantined:,} 行 ({time.perf_counter() - start:.1f} 秒)",
+                  file=log)
+    finally:
+        if scorer is not None:
+            scorer.close()
+
+    return top, total_rows
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        top, total_rows = score_file(args)
+    except (OSError, ValueError) as e:
+        print(f"数据处理出错: {e}", file=sys.stderr)
+        return 1
+
+    top_df = top.to_frame()
+    if args.top_output:
+        top_df.to_csv(args.top_output, index=False, encoding=args.encoding)
+    else:
+        top_df.to_csv(sys.stdout, index=False)
+    print(f"共评分 {total_rows:,} 行，已输出前 {len(top_df)} 名", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
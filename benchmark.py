@@ -0,0 +1,366 @@
+"""性能基准测试
+
+用固定随机种子向量化生成任意规模的多店对比数据和聚类分析数据，分别在多个数据规模下测量
+批量评分、CSV 读取与校验、KMeans 拟合、优劣势报告生成和图表渲染的耗时、吞吐量 (行/秒)
+与峰值内存，以及页面脚本在新进程中的冷启动耗时，追加写入结果文件，并与结果文件中同一项目、同一规模的上一次记录比较，
+评分等代码修改后可以及时发现性能退化。
+
+峰值内存由 tracemalloc 统计，包含 numpy 数组和 Python 对象，不含 Arrow、scikit-learn
+内部在 C/C++ 层直接申请的内存；测量内存的一遍单独运行，不计入耗时。启动测试记录的是子进程的
+峰值常驻内存 (RSS)。
+
+用法示例:
+    python benchmark.py --sizes 1000 10000 100000 1000000 -o 性能测试结果.csv
+    python benchmark.py --benchmarks 评分 报告 --sizes 10000000 --repeat 1 --check
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+import clustering
+import plotting
+import schema
+import scoring
+import store
+import validation
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_RESULTS_PATH = "性能测试结果.csv"
+DEFAULT_SEED = 42
+# 与上一次记录相比耗时增加超过该比例视为性能退化
+DEFAULT_TOLERANCE = 0.2
+# 耗时增加不足该秒数时不算退化 (小规模测试的计时波动)
+MIN_REGRESSION_SECONDS = 0.05
+RESULT_COLUMNS = ["测试时间", "标签", "测试项目", "行数", "耗时(秒)", "吞吐量(行/秒)", "峰值内存(MB)"]
+
+CLUSTER_FEATURES = ["人流量", "每平米租金", "竞争对手数量", "交通便利性"]
+# 聚类示例数据中各类位置的特征中心 (人流量、每平米租金、竞争对手数量、交通便利性)
+CLUSTER_CENTERS = np.array([
+    [4000, 600, 7, 9],
+    [2500, 300, 4, 7],
+    [1200, 150, 2, 5],
+    [700, 120, 1, 3],
+], dtype=np.float64)
+CLUSTER_SPREADS = np.array([600, 80, 1.5, 1], dtype=np.float64)
+
+# 主要城市中心 (纬度, 经度)，生成的位置围绕这些中心分布
+CITY_CENTERS = np.array([
+    [39.91, 116.40], [31.23, 121.47], [23.13, 113.26], [22.54, 114.06],
+    [30.57, 104.07], [30.27, 120.16], [34.26, 108.94], [36.07, 120.38],
+])
+
+
+def _categorical(rng, labels, probabilities, n):
+    # 直接由编码构造分类列，避免生成 n 个字符串
+    codes = rng.choice(len(labels), size=n, p=probabilities)
+    return pd.Categorical.from_codes(codes, categories=list(labels))
+
+
+def _rating(rng, mean, n, high=10):
+    return np.clip(np.rint(rng.normal(mean, 1.8, n)), 0, high).astype(np.uint8)
+
+
+def _site_names(n):
+    return "位置" + pd.RangeIndex(1, n + 1).astype(str)
+
+
+def comparison_table(n, seed=DEFAULT_SEED):
+    """生成 n 行多店对比数据 (包含全部必需列、可选列及经纬度)
+
+    租金与城市等级、商圈类型和面积相关，各时段人流量与商圈热度相关，竞争对手数量随人流量增加。
+    """
+    rng = np.random.default_rng(seed)
+    city = _categorical(rng, scoring.CITY_RENT_STANDARDS, [0.15, 0.3, 0.3, 0.25], n)
+    district = _categorical(rng, scoring.DISTRICT_TYPES, [0.2, 0.35, 0.35, 0.1], n)
+
+    area = np.clip(np.rint(rng.lognormal(np.log(100), 0.45, n)), 20, 500)
+    # 核心商圈租金和人流量最高
+    district_factor = np.array([1.6, 1.1, 0.8, 1.2])[district.codes]
+    standard_rent = np.array(list(scoring.CITY_RENT_STANDARDS.values()), dtype=np.float64)[city.codes]
+    rent = np.rint(area * standard_rent * district_factor * rng.lognormal(0, 0.3, n))
+
+    busy = district_factor * rng.lognormal(0, 0.5, n)
+    traffic = {
+        name: np.clip(np.rint(level * busy * rng.lognormal(0, 0.2, n)), 0, 10_000).astype(np.uint16)
+        for name, level in [("早高峰人流量", 900), ("午高峰人流量", 1300), ("晚高峰人流量", 1700),
+                            ("周末人流量", 2200), ("节假日人流量", 2700)]
+    }
+    competitors = np.minimum(rng.poisson(2 * busy), 50)
+
+    centers = CITY_CENTERS[rng.integers(len(CITY_CENTERS), size=n)]
+    return pd.DataFrame({
+        "位置名称": _site_names(n),
+        "城市等级": city,
+        "商圈类型": district,
+        "店铺面积": area.astype(np.uint16),
+        "月租金": rent.astype(np.uint32),
+        **traffic,
+        "竞争对手数量": competitors.astype(np.uint8),
+        "最近竞争对手距离": np.clip(np.rint(rng.exponential(600 / (1 + competitors))), 10, 5000).astype(np.uint16),
+        "市场饱和度": np.clip(np.rint(rng.normal(50 + 5 * competitors, 15)), 0, 100).astype(np.uint8),
+        "竞争优势评估": np.clip(np.rint(rng.normal(60, 15, n)), 0, 100).astype(np.uint8),
+        "交通便利性": _rating(rng, 6.5, n),
+        "周边配套完善度": _rating(rng, 6.5, n),
+        "停车位数量": np.minimum(rng.poisson(50, n), 500).astype(np.uint16),
+        "公交地铁站数量": np.minimum(rng.poisson(3, n), 20).astype(np.uint8),
+        "周边住宅密度": _rating(rng, 6, n),
+        "周边商业密度": _rating(rng, 6, n),
+        "目标人群匹配度": _rating(rng, 7, n),
+        "年龄结构匹配度": _rating(rng, 7, n),
+        "收入水平匹配度": _rating(rng, 6.5, n),
+        "消费习惯匹配度": _rating(rng, 6.5, n),
+        "纬度": centers[:, 0] + rng.normal(0, 0.08, n),
+        "经度": centers[:, 1] + rng.normal(0, 0.08, n),
+    })
+
+
+def clustering_table(n, seed=DEFAULT_SEED):
+    """生成 n 行聚类分析数据，位置围绕 CLUSTER_CENTERS 中的几类典型位置分布"""
+    rng = np.random.default_rng(seed)
+    values = CLUSTER_CENTERS[rng.integers(len(CLUSTER_CENTERS), size=n)]
+    values = np.maximum(values + rng.normal(size=values.shape) * CLUSTER_SPREADS, 0)
+    return pd.DataFrame({
+        "位置名称": _site_names(n),
+        "人流量": np.rint(values[:, 0]).astype(np.uint32),
+        "每平米租金": np.round(values[:, 1], 2).astype(np.float32),
+        "竞争对手数量": np.rint(values[:, 2]).astype(np.uint8),
+        "交通便利性": np.clip(np.rint(values[:, 3]), 0, 10).astype(np.uint8),
+    })
+
+
+def write_csv(df, path):
+    """用 Arrow 快速写出 CSV (千万行数据用 pandas 写出过慢)"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # 分类列先还原为字符串
+    columns = [column.cast(pa.string()) if pa.types.is_dictionary(column.type) else column
+               for column in table.columns]
+    pa_csv.write_csv(pa.Table.from_arrays(columns, names=table.column_names), path)
+
+
+# 各测试项目: 由数据规模准备输入 (不计时)，返回被测函数
+def _bench_scoring(n, seed, workdir):
+    df = comparison_table(n, seed)
+
+    def run():
+        matrix = scoring.compute_dimension_scores(df)
+        overall = scoring.weighted_scores(matrix, scoring.DEFAULT_WEIGHTS)
+        return scoring.rank_top_k(overall, 100)
+    return run
+
+
+def _bench_ingest(n, seed, workdir):
+    path = os.path.join(workdir, f"多店对比_{n}.csv")
+    if not os.path.exists(path):
+        write_csv(comparison_table(n, seed), path)
+
+    def run():
+        # 与批量评分相同的按块读取和校验
+        rows = 0
+        for chunk in schema.iter_table_chunks(path, path, schema.COMPARISON_SCHEMA):
+            rows += len(validation.validate(chunk, validation.COMPARISON_RULES,
+                                            data_schema=schema.COMPARISON_SCHEMA).clean)
+        return rows
+    return run
+
+
+def _bench_clustering(engine):
+    def prepare(n, seed, workdir):
+        df = clustering_table(n, seed)
+        chunk_factory = clustering.frame_chunks(df, CLUSTER_FEATURES)
+        return lambda: clustering.fit_clusters(chunk_factory, CLUSTER_FEATURES, len(CLUSTER_CENTERS), engine)
+    return prepare
+
+
+def _bench_report(n, seed, workdir):
+    df = comparison_table(n, seed)
+    matrix = scoring.compute_dimension_scores(df)
+    overall = scoring.weighted_scores(matrix, scoring.DEFAULT_WEIGHTS)
+    return lambda: scoring.strengths_report(df["位置名称"], matrix, overall)
+
+
+def _bench_charts(n, seed, workdir):
+    df = comparison_table(n, seed)
+    matrix = scoring.compute_dimension_scores(df)
+    overall = scoring.weighted_scores(matrix, scoring.DEFAULT_WEIGHTS)
+    cluster_df = clustering_table(n, seed)
+    labels = np.argmin(np.abs(cluster_df["人流量"].to_numpy()[:, None] - CLUSTER_CENTERS[:, 0]), axis=1)
+
+    def run():
+        # 与多店对比、数据分析页面相同的图表: 前20名柱状图、雷达图和聚类散点图
+        top = scoring.rank_top_k(overall, 20)
+        plotting.score_bar_chart(df["位置名称"].to_numpy()[top], overall[top], 20)
+        plotting.radar_chart(scoring.CATEGORIES, [(df["位置名称"].iloc[i], matrix[i].tolist()) for i in top[:3]],
+                             "各位置维度得分对比雷达图")
+        plotting.cluster_scatter(cluster_df["人流量"], cluster_df["每平米租金"], labels,
+                                 "人流量", "每平米租金", "聚类结果")
+    return run
+
+
+BENCHMARKS = {
+    "评分": _bench_scoring,
+    "CSV读取": _bench_ingest,
+    "KMeans": _bench_clustering("kmeans"),
+    "MiniBatchKMeans": _bench_clustering("minibatch"),
+    "报告": _bench_report,
+    "图表": _bench_charts,
+}
+# 耗时随行数增长过快的项目只在不超过该规模时运行
+MAX_ROWS = {"KMeans": 1_000_000}
+
+# 启动测试: 在新进程中用 Streamlit AppTest 运行页面脚本 (未上传数据)，首次运行包含各模块的导入，
+# 对应服务启动后的首次渲染；再运行一次对应每次交互的重新运行
+STARTUP_BENCHMARK = "启动"
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+_STARTUP_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=300)
+start = time.perf_counter()
+app.run()
+first = time.perf_counter()
+app.run()
+rerun = time.perf_counter()
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+except ImportError:
+    rss = None
+# AppTest 本身会导入 matplotlib 顶层包，以绘图模块判断页面是否导入了 matplotlib
+heavy = [name for name in ("sklearn", "matplotlib.figure") if name in sys.modules]
+print(json.dumps({"first": first - start, "rerun": rerun - first, "rss": rss,
+                  "errors": [str(e.value) for e in app.exception], "heavy": heavy}))
+"""
+
+
+def measure_startup(repeat=3):
+    """返回首次运行和重新运行的最短耗时 (秒)、子进程峰值常驻内存 (字节) 及已导入的重量级模块"""
+    runs = []
+    # 在空的临时目录中运行且不指定数据库路径，历史记录标签页不会读取已有的数据库，各次测量条件一致
+    env = {name: value for name, value in os.environ.items() if name != store.ENV_VARIABLE}
+    env["PYTHONPATH"] = os.path.dirname(APP_PATH)
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(repeat):
+            completed = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT, APP_PATH], cwd=workdir, env=env,
+                                       capture_output=True, text=True, check=True)
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    if runs[0]["errors"]:
+        raise RuntimeError(f"页面运行出错: {'; '.join(runs[0]['errors'])}")
+    rss = [run["rss"] for run in runs if run["rss"] is not None]
+    return (min(run["first"] for run in runs), min(run["rerun"] for run in runs),
+            max(rss) if rss else None, runs[0]["heavy"])
+
+
+def measure(run, repeat=3, memory=True):
+    """返回多次运行中最短的耗时 (秒) 和单独一次运行的峰值内存 (字节，memory 为 False 时为空)"""
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return min(seconds), peak
+
+
+def run_benchmarks(names, sizes, repeat=3, memory=True, seed=DEFAULT_SEED, label="", log=sys.stderr):
+    """运行所选测试项目，返回结果表 (每个项目、规模一行)"""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            if name == STARTUP_BENCHMARK:
+                first, rerun, rss, heavy = measure_startup(repeat)
+                peak = np.nan if rss is None else rss / 1024 ** 2
+                records.append([now, label, f"{name}(首次运行)", 0, first, np.nan, peak])
+                records.append([now, label, f"{name}(重新运行)", 0, rerun, np.nan, peak])
+                print(f"{name}: 首次运行 {first:.3f} 秒, 重新运行 {rerun:.3f} 秒"
+                      + (f", 已导入 {', '.join(heavy)}" if heavy else ""), file=log)
+                continue
+            for n in sizes:
+                if n > MAX_ROWS.get(name, n):
+                    print(f"{name} {n:,} 行: 超过该项目的规模上限 {MAX_ROWS[name]:,}，跳过", file=log)
+                    continue
+                run = BENCHMARKS[name](n, seed, workdir)
+                seconds, peak = measure(run, repeat, memory)
+                records.append([now, label, name, n, seconds, n / seconds if seconds > 0 else np.inf,
+                                np.nan if peak is None else peak / 1024 ** 2])
+                print(f"{name} {n:,} 行: {seconds:.3f} 秒, {n / max(seconds, 1e-9):,.0f} 行/秒"
+                      + ("" if peak is None else f", 峰值内存 {peak / 1024 ** 2:,.1f} MB"), file=log)
+                del run
+    return pd.DataFrame(records, columns=RESULT_COLUMNS)
+
+
+def compare(results, previous, tolerance=DEFAULT_TOLERANCE):
+    """与上一次记录比较，返回附加 耗时变化 与 是否退化 列的结果表"""
+    key = ["测试项目", "行数"]
+    if previous is None or previous.empty:
+        return results.assign(上次耗时=np.nan, 耗时变化=np.nan, 性能退化=False)
+    last = previous.drop_duplicates(key, keep="last")[key + ["耗时(秒)"]].rename(columns={"耗时(秒)": "上次耗时"})
+    merged = results.merge(last, on=key, how="left")
+    merged["耗时变化"] = merged["耗时(秒)"] / merged["上次耗时"] - 1
+    merged["性能退化"] = ((merged["耗时变化"] > tolerance)
+                        & (merged["耗时(秒)"] - merged["上次耗时"] > MIN_REGRESSION_SECONDS))
+    return merged
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="门店选址模型性能基准测试")
+    names = list(BENCHMARKS) + [STARTUP_BENCHMARK]
+    parser.add_argument("--benchmarks", nargs="+", choices=names, default=names,
+                        help="要运行的测试项目 (默认全部)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="数据规模 (行数)，默认 1000 10000 100000 1000000")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最短耗时 (默认3)")
+    parser.add_argument("--no-memory", action="store_true", help="不测量峰值内存 (省去额外的一遍运行)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="生成数据的随机种子 (默认42)")
+    parser.add_argument("--label", default="", help="记录在结果中的标签，如代码版本")
+    parser.add_argument("-o", "--output", default=DEFAULT_RESULTS_PATH,
+                        help=f"追加写入的结果文件 (默认{DEFAULT_RESULTS_PATH})")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="耗时比上一次记录增加超过该比例时视为性能退化 (默认0.2)")
+    parser.add_argument("--check", action="store_true", help="出现性能退化时以非零状态退出")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    previous = None
+    if os.path.exists(args.output):
+        previous = pd.read_csv(args.output, encoding="utf-8-sig")
+
+    results = run_benchmarks(args.benchmarks, args.sizes, args.repeat, not args.no_memory, args.seed, args.label)
+    results.to_csv(args.output, mode="a" if previous is not None else "w", header=previous is None,
+                   index=False, encoding="utf-8-sig")
+
+    compared = compare(results, previous, args.tolerance)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(compared.drop(columns=["测试时间", "标签"]).to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+    regressions = compared[compared["性能退化"]]
+    if len(regressions):
+        print(f"{len(regressions)} 项耗时比上一次记录增加超过 {args.tolerance:.0%}", file=sys.stderr)
+        return 1 if args.check else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
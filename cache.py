@@ -0,0 +1,190 @@
+"""进程内共享缓存
+
+同一服务进程中的所有会话共用一个缓存，保存解析后的数据、得分矩阵、聚类结果、渲染好的图表等。
+键为函数名加上各参数 (上传文件的内容哈希和计算参数)，以下划线开头的参数不参与计算键
+(与 st.cache_resource 的约定相同)。缓存按估算的内存占用计入总预算，超出预算时淘汰最久未使用的结果，
+并统计命中、未命中和淘汰次数。
+
+多个会话同时请求同一个未缓存的结果时只计算一次，其余会话等待后直接取用。
+"""
+import dataclasses
+import functools
+import inspect
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# 设置该环境变量可调整缓存的内存预算 (MB)
+ENV_VARIABLE = "SITE_SELECTION_CACHE_MB"
+DEFAULT_BUDGET_MB = 1024
+_MB = 1024 ** 2
+# 估算对象内存时最多向下展开的层数
+_MAX_DEPTH = 6
+
+
+def estimate_size(value, _seen=None, _depth=0):
+    """估算对象占用的内存 (字节)：数组和表格按数据大小计，容器、数据类和普通对象逐层累加"""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen or _depth > _MAX_DEPTH:
+        return 0
+    _seen.add(id(value))
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(item, _seen, _depth + 1) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k, _seen, _depth + 1) + estimate_size(v, _seen, _depth + 1)
+                                          for k, v in value.items())
+    size = sys.getsizeof(value)
+    if hasattr(value, "get_arrays"):
+        # scikit-learn 的 KDTree 等扩展类型没有 __dict__，数据通过 get_arrays 取得
+        size += sum(estimate_size(array, _seen, _depth + 1) for array in value.get_arrays())
+    if hasattr(value, "__dict__"):
+        size += estimate_size(vars(value), _seen, _depth + 1)
+    elif hasattr(value, "__slots__"):
+        size += sum(estimate_size(getattr(value, name, None), _seen, _depth + 1) for name in value.__slots__)
+    return size
+
+
+def _freeze(value):
+    # 把参数转换为可哈希的键 (列表转为元组，非冻结的数据类按字段取值)
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return (type(value).__name__,) + tuple(_freeze(getattr(value, field.name))
+                                               for field in dataclasses.fields(value))
+    return value
+
+
+@dataclasses.dataclass
+class CacheStats:
+    entries: int
+    used_bytes: int
+    budget_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class SharedCache:
+    """线程安全的 LRU 缓存，按估算的内存占用而不是条目数量淘汰"""
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+        # 正在计算的键，其他线程等待同一把锁而不是重复计算
+        self._pending = {}
+        self.hits = self.misses = self.evictions = 0
+
+    def _lookup(self, key):
+        # 调用方需持有 self._lock
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def get_or_compute(self, key, compute):
+        """返回键对应的结果，不存在时调用 compute() 计算并缓存"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry[0]
+            key_lock = self._pending.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry[0]
+                self.misses += 1
+            try:
+                value = compute()
+                self.put(key, value)
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+        return value
+
+    def put(self, key, value):
+        """写入结果；单个结果超过总预算时不缓存"""
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._used -= self._entries.pop(key)[1]
+            if size > self.budget_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._used += size
+            while self._used > self.budget_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._used -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used = 0
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(len(self._entries), self._used, self.budget_bytes,
+                              self.hits, self.misses, self.evictions)
+
+
+def memoize(shared_cache, on_miss=None):
+    """函数装饰器：以函数名和不以下划线开头的参数为键缓存结果
+
+    on_miss 为返回上下文管理器的函数 (如显示加载提示)，只在需要计算时进入。
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (name,) + tuple((param, _freeze(value)) for param, value in bound.arguments.items()
+                                  if not param.startswith("_"))
+
+            def compute():
+                if on_miss is None:
+                    return func(*args, **kwargs)
+                with on_miss():
+                    return func(*args, **kwargs)
+            return shared_cache.get_or_compute(key, compute)
+        return wrapper
+    return decorator
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """进程内唯一的共享缓存，预算由环境变量 SITE_SELECTION_CACHE_MB 设置 (默认 1024 MB)"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            budget_mb = float(os.environ.get(ENV_VARIABLE, DEFAULT_BUDGET_MB))
+            _default_cache = SharedCache(int(budget_mb * _MB))
+        return _default_cache
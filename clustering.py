@@ -0,0 +1,237 @@
+"""聚类分析后端
+
+提供两种聚类引擎：
+- 精确 KMeans：在完整的标准化矩阵上拟合
+- MiniBatchKMeans：逐块 partial_fit，可处理无法一次载入内存的文件
+
+两种引擎都使用逐块 partial_fit 得到的 MinMaxScaler，因此标准化结果只取决于数据本身。
+自动选择K值时，标准化矩阵只在共享内存中保存一份，由多个进程并行拟合不同的K。
+scikit-learn 导入较慢，只在实际拟合时才导入，打开页面和对新位置分类 (ClusterModel) 都不需要它。
+"""
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import numpy as np
+from threadpoolctl import threadpool_limits
+
+ENGINES = {
+    "KMeans (精确)": "kmeans",
+    "MiniBatchKMeans (流式)": "minibatch",
+}
+DEFAULT_CHUNKSIZE = 100_000
+# 轮廓系数为 O(n²)，只在抽样子集上计算
+SILHOUETTE_SAMPLE_SIZE = 10_000
+
+
+@dataclass
+class ClusterResult:
+    labels: np.ndarray
+    scaler: object
+    model: object
+    features: list
+    inertia: float
+    fit_seconds: float
+
+
+@dataclass
+class ClusterModel:
+    """可持久化的聚类模型：特征列表、MinMax标准化参数和聚类中心"""
+    features: list
+    scale: np.ndarray
+    offset: np.ndarray
+    centroids: np.ndarray
+    counts: np.ndarray
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(list(result.features), result.scaler.scale_.copy(), result.scaler.min_.copy(),
+                   np.asarray(result.model.cluster_centers_, dtype=np.float64).copy(),
+                   np.bincount(result.labels, minlength=len(result.model.cluster_centers_)).astype(np.int64))
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    def transform(self, df):
+        # 与 MinMaxScaler.transform 相同: X * scale_ + min_
+        return df[self.features].to_numpy(dtype=np.float64) * self.scale + self.offset
+
+    def predict(self, df, chunksize=DEFAULT_CHUNKSIZE):
+        """把每一行分配给最近的聚类中心"""
+        labels = np.empty(len(df), dtype=np.int64)
+        centroid_norms = (self.centroids ** 2).sum(axis=1)
+        for start in range(0, len(df), chunksize):
+            scaled = self.transform(df.iloc[start:start + chunksize])
+            # ||x - c||² = ||x||² - 2x·c + ||c||²，其中 ||x||² 不影响最近中心的选择
+            distances = centroid_norms - 2 * scaled @ self.centroids.T
+            labels[start:start + len(scaled)] = distances.argmin(axis=1)
+        return labels
+
+    def update(self, df):
+        """分配新数据并按累计样本数增量更新聚类中心，返回新数据的标签"""
+        labels = self.predict(df)
+        scaled = self.transform(df)
+        new_counts = np.bincount(labels, minlength=self.n_clusters)
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, labels, scaled)
+        totals = self.counts + new_counts
+        seen = new_counts > 0
+        self.centroids[seen] += (sums[seen] - new_counts[seen, None] * self.centroids[seen]) / totals[seen, None]
+        self.counts = totals
+        return labels
+
+    def save(self, file):
+        """保存为 .npz 文件 (不含 pickle 对象，可安全加载)"""
+        np.savez(file, features=np.array(self.features, dtype=str), scale=self.scale,
+                 offset=self.offset, centroids=self.centroids, counts=self.counts)
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        self.save(buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def load(cls, file):
+        if isinstance(file, bytes):
+            file = io.BytesIO(file)
+        with np.load(file, allow_pickle=False) as bundle:
+            return cls(bundle["features"].tolist(), bundle["scale"], bundle["offset"],
+                       bundle["centroids"].astype(np.float64), bundle["counts"].astype(np.int64))
+
+
+@dataclass
+class KSweepResult:
+    k_values: list
+    inertias: list
+    silhouettes: list
+    recommended: int
+    seconds: float
+
+
+def frame_chunks(df, features, chunksize=DEFAULT_CHUNKSIZE):
+    """返回按块遍历内存中 DataFrame 的迭代器工厂"""
+    selected = df[features]
+
+    def factory():
+        for start in range(0, len(selected), chunksize):
+            yield selected.iloc[start:start + chunksize]
+    return factory
+
+
+def fit_scaler(chunk_factory):
+    """逐块拟合 MinMaxScaler"""
+    from sklearn.preprocessing import MinMaxScaler
+
+    scaler = MinMaxScaler()
+    for chunk in chunk_factory():
+        scaler.partial_fit(chunk.to_numpy(dtype=np.float64))
+    return scaler
+
+
+def _scaled_chunks(chunk_factory, scaler):
+    for chunk in chunk_factory():
+        yield scaler.transform(chunk.to_numpy(dtype=np.float64))
+
+
+def _make_model(n_clusters, engine, batch_size=4096):
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    if engine == "minibatch":
+        return MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, n_init=3, random_state=42)
+    return KMeans(n_clusters=n_clusters, n_init=10, random_state=42)
+
+
+def _fit_exact(chunk_factory, scaler, n_clusters):
+    scaled_data = np.concatenate(list(_scaled_chunks(chunk_factory, scaler)))
+    model = _make_model(n_clusters, "kmeans")
+    labels = model.fit_predict(scaled_data)
+    return model, labels, float(model.inertia_)
+
+
+def _fit_minibatch(chunk_factory, scaler, n_clusters, batch_size):
+    model = _make_model(n_clusters, "minibatch", batch_size)
+    for scaled in _scaled_chunks(chunk_factory, scaler):
+        for start in range(0, len(scaled), batch_size):
+            batch = scaled[start:start + batch_size]
+            # 首次 partial_fit 的样本数不能少于聚类数量
+            if not hasattr(model, "cluster_centers_") and len(batch) < n_clusters:
+                continue
+            model.partial_fit(batch)
+
+    # 最后一遍分配标签并累计惯性
+    labels, inertia = [], 0.0
+    for scaled in _scaled_chunks(chunk_factory, scaler):
+        labels.append(model.predict(scaled))
+        inertia -= model.score(scaled)
+    return model, np.concatenate(labels), inertia
+
+
+def fit_clusters(chunk_factory, features, n_clusters, engine="kmeans", batch_size=4096):
+    """按所选引擎执行聚类，返回标签、标准化器、模型、惯性和拟合耗时"""
+    start = time.perf_counter()
+    scaler = fit_scaler(chunk_factory)
+    if engine == "minibatch":
+        model, labels, inertia = _fit_minibatch(chunk_factory, scaler, n_clusters, batch_size)
+    else:
+        model, labels, inertia = _fit_exact(chunk_factory, scaler, n_clusters)
+    return ClusterResult(labels, scaler, model, list(features), inertia, time.perf_counter() - start)
+
+
+def _evaluate_k(scaled, n_clusters, engine, sample_size, threads):
+    from sklearn.metrics import silhouette_score
+
+    # 限制每个进程的线程数，避免多个进程争抢CPU
+    with threadpool_limits(threads):
+        model = _make_model(n_clusters, engine)
+        labels = model.fit_predict(scaled)
+        silhouette = silhouette_score(scaled, labels, sample_size=min(sample_size, len(scaled)),
+                                      random_state=42)
+    return float(model.inertia_), float(silhouette)
+
+
+def _evaluate_k_shared(spec):
+    name, shape, n_clusters, engine, sample_size, threads = spec
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return _evaluate_k(np.ndarray(shape, dtype=np.float64, buffer=block.buf),
+                           n_clusters, engine, sample_size, threads)
+    finally:
+        block.close()
+
+
+def sweep_k(chunk_factory, k_values, engine="kmeans", workers=None,
+            sample_size=SILHOUETTE_SAMPLE_SIZE):
+    """并行拟合多个K值，返回惯性 (肘部法则)、抽样轮廓系数和推荐的K"""
+    start = time.perf_counter()
+    k_values = list(k_values)
+    scaler = fit_scaler(chunk_factory)
+    scaled = np.concatenate(list(_scaled_chunks(chunk_factory, scaler)))
+
+    cpu_count = os.cpu_count() or 1
+    workers = min(workers or cpu_count, len(k_values))
+    threads = max(1, cpu_count // workers)
+    if workers <= 1:
+        metrics = [_evaluate_k(scaled, k, engine, sample_size, threads) for k in k_values]
+    else:
+        block = shared_memory.SharedMemory(create=True, size=max(1, scaled.nbytes))
+        try:
+            np.ndarray(scaled.shape, dtype=np.float64, buffer=block.buf)[:] = scaled
+            shape = scaled.shape
+            del scaled
+            specs = [(block.name, shape, k, engine, sample_size, threads) for k in k_values]
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                metrics = list(pool.map(_evaluate_k_shared, specs))
+        finally:
+            block.close()
+            block.unlink()
+
+    inertias = [inertia for inertia, _ in metrics]
+    silhouettes = [silhouette for _, silhouette in metrics]
+    recommended = k_values[int(np.argmax(silhouettes))]
+    return KSweepResult(k_values, inertias, silhouettes, recommended, time.perf_counter() - start)
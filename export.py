@@ -0,0 +1,113 @@
+"""结果导出
+
+评分、聚类等结果按块写入 SpooledTemporaryFile：文件较小时留在内存，超过 SPOOL_SIZE 后自动转存到
+磁盘临时文件，不会先在内存中拼出整个 CSV 字符串再编码。支持三种格式:
+- CSV: utf-8-sig 编码 (Excel 直接打开不乱码)，逐块追加
+- Parquet: 逐块写入行组，体积小、读取快
+- XLSX: openpyxl 只写模式逐行写入，超过单个工作表行数上限时自动续写到新工作表
+"""
+import codecs
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# 显示名称 -> 文件扩展名
+FORMATS = {"CSV": "csv", "Parquet": "parquet", "Excel (XLSX)": "xlsx"}
+MIME_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/octet-stream",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+DEFAULT_CHUNKSIZE = 100_000
+# 超过该大小的导出文件转存到磁盘
+SPOOL_SIZE = 32 * 1024 * 1024
+# Excel 单个工作表的行数上限 (含表头)
+XLSX_MAX_ROWS = 1_048_576
+SHEET_NAME = "数据"
+
+
+def iter_chunks(data, chunksize=DEFAULT_CHUNKSIZE):
+    """DataFrame 按行切块；已是分块迭代器时原样返回"""
+    if isinstance(data, pd.DataFrame):
+        return (data.iloc[start:start + chunksize] for start in range(0, max(len(data), 1), chunksize))
+    return iter(data)
+
+
+def _write_csv(chunks, file):
+    # BOM 只写一次，之后各块按 utf-8 追加
+    file.write(codecs.BOM_UTF8)
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(file, index=False, header=i == 0, encoding="utf-8")
+
+
+def _write_parquet(chunks, file):
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(file, table.schema)
+            else:
+                # 后续各块按第一块的类型写入
+                table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _excel_values(chunk):
+    # 转换为 Python 对象，缺失值写为空单元格
+    values = chunk.astype(object)
+    return values.where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+def _write_xlsx(chunks, file):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet, rows, header = None, 0, []
+    for chunk in chunks:
+        header = [str(name) for name in chunk.columns]
+        for row in _excel_values(chunk):
+            if sheet is None or rows >= XLSX_MAX_ROWS:
+                # 超过行数上限时续写到新工作表 (数据2、数据3 ...)
+                suffix = len(workbook.worksheets) + 1 if sheet is not None else ""
+                sheet = workbook.create_sheet(f"{SHEET_NAME}{suffix}")
+                sheet.append(header)
+                rows = 1
+            sheet.append(row)
+            rows += 1
+    if sheet is None:
+        # 没有数据行时只写表头
+        sheet = workbook.create_sheet(SHEET_NAME)
+        sheet.append(header)
+    workbook.save(file)
+
+
+_WRITERS = {"csv": _write_csv, "parquet": _write_parquet, "xlsx": _write_xlsx}
+
+
+def export_table(data, fmt, chunksize=DEFAULT_CHUNKSIZE, spool_size=SPOOL_SIZE):
+    """把 DataFrame 或分块迭代器按块导出为 fmt 格式 (csv/parquet/xlsx)
+
+    返回已回到开头的临时文件，由调用方读取后关闭。
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    try:
+        _WRITERS[fmt](iter_chunks(data, chunksize), file)
+    except Exception:
+        file.close()
+        raise
+    file.seek(0)
+    return file
+
+
+def export_bytes(data, fmt, chunksize=DEFAULT_CHUNKSIZE):
+    """导出为字节串 (用于下载按钮)"""
+    with export_table(data, fmt, chunksize) as file:
+        return file.read()
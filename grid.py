@@ -0,0 +1,133 @@
+"""城市网格评分
+
+把经纬度范围切分为固定边长的网格，根据各空间图层 (竞争对手、公共交通站点、人流量监测点、
+周边配套、租金样本) 为每个网格计算六个维度得分。计算按块进行，得分矩阵与权重无关，
+可以缓存后在调整权重时只重新加权。
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+import scoring
+import spatial
+
+METERS_PER_DEGREE = 111_320
+DEFAULT_CELL_SIZE = 100  # 米
+MAX_CELLS = 20_000_000
+TILE_CELLS = 200_000
+# 统计半径内配套点位达到该数量时，周边配套完善度记为满分10分
+AMENITY_SATURATION = 20
+
+# 图层: 键名 -> (显示名称, 数值列)
+LAYERS = {
+    "competitors": ("竞争对手", None),
+    "transit": ("公共交通站点", None),
+    "traffic": ("人流量监测点", "人流量"),
+    "amenities": ("周边配套", None),
+    "rent": ("租金样本", "每平米租金"),
+}
+
+# 图层无法提供的输入使用单店评估表单的默认值
+GRID_DEFAULTS = {
+    "店铺面积": 100,
+    "月租金": 10000,
+    "早高峰人流量": 1000,
+    "午高峰人流量": 1500,
+    "晚高峰人流量": 2000,
+    "周末人流量": 2500,
+    "节假日人流量": 3000,
+    "竞争对手数量": 3,
+    "最近竞争对手距离": 200,
+    "市场饱和度": 50,
+    "竞争优势评估": 60,
+    "交通便利性": 7,
+    "周边配套完善度": 8,
+    **scoring.OPTIONAL_COLUMNS,
+}
+
+
+@dataclass
+class Grid:
+    lat_min: float
+    lat_max: float
+    lon_min: float
+    lon_max: float
+    cell_size: float = DEFAULT_CELL_SIZE
+
+    @property
+    def lat_step(self):
+        return self.cell_size / METERS_PER_DEGREE
+
+    @property
+    def lon_step(self):
+        mid_lat = np.radians((self.lat_min + self.lat_max) / 2)
+        return self.cell_size / (METERS_PER_DEGREE * np.cos(mid_lat))
+
+    @property
+    def shape(self):
+        n_rows = max(1, int(np.ceil((self.lat_max - self.lat_min) / self.lat_step)))
+        n_cols = max(1, int(np.ceil((self.lon_max - self.lon_min) / self.lon_step)))
+        return n_rows, n_cols
+
+    @property
+    def size(self):
+        n_rows, n_cols = self.shape
+        return n_rows * n_cols
+
+    def centers(self, start, stop):
+        """网格编号 [start, stop) 的中心点经纬度"""
+        return self.centers_of(np.arange(start, stop))
+
+    def centers_of(self, cells):
+        """指定网格编号的中心点经纬度 (按行优先编号)"""
+        rows, cols = np.divmod(np.asarray(cells), self.shape[1])
+        return (self.lat_min + (rows + 0.5) * self.lat_step,
+                self.lon_min + (cols + 0.5) * self.lon_step)
+
+
+def _tile_inputs(lat, lon, layers, radius_m):
+    # 根据各图层计算一块网格的评分输入
+    inputs = {name: np.full(len(lat), value, dtype=np.float64) for name, value in GRID_DEFAULTS.items()}
+    if layers.get("competitors") is not None:
+        inputs["竞争对手数量"] = layers["competitors"].count_within(lat, lon, radius_m).astype(np.float64)
+        inputs["最近竞争对手距离"] = layers["competitors"].nearest_distance(lat, lon)
+    if layers.get("transit") is not None:
+        inputs["公交地铁站数量"] = layers["transit"].count_within(lat, lon, radius_m).astype(np.float64)
+    if layers.get("traffic") is not None:
+        traffic = layers["traffic"].interpolate(lat, lon)
+        for name in ["早高峰人流量", "午高峰人流量", "晚高峰人流量", "周末人流量", "节假日人流量"]:
+            inputs[name] = traffic
+    if layers.get("amenities") is not None:
+        count = layers["amenities"].count_within(lat, lon, radius_m)
+        inputs["周边配套完善度"] = np.minimum(10, count / AMENITY_SATURATION * 10)
+    if layers.get("rent") is not None:
+        inputs["月租金"] = layers["rent"].interpolate(lat, lon) * inputs["店铺面积"]
+    return inputs
+
+
+def score_grid(grid, layers, city_level, radius_m=spatial.DEFAULT_COMPETITOR_RADIUS, tile_cells=TILE_CELLS):
+    """按块计算全部网格的六个维度得分，返回 (网格数×6) 的 float32 矩阵"""
+    if grid.size > MAX_CELLS:
+        raise ValueError(f"网格数量 {grid.size:,} 超过上限 {MAX_CELLS:,}，请缩小范围或增大网格边长")
+    matrix = np.empty((grid.size, len(scoring.SCORE_COLUMNS)), dtype=np.float32)
+    standard_rent = scoring.city_rent_standard(city_level)
+    tile = np.empty((tile_cells, len(scoring.SCORE_COLUMNS)), dtype=np.float64)
+    for start in range(0, grid.size, tile_cells):
+        stop = min(start + tile_cells, grid.size)
+        lat, lon = grid.centers(start, stop)
+        inputs = _tile_inputs(lat, lon, layers, radius_m)
+        scoring.dimension_scores(inputs.__getitem__, standard_rent, tile[:stop - start])
+        matrix[start:stop] = tile[:stop - start]
+    return matrix
+
+
+def top_cells(grid, matrix, overall, k):
+    """综合评分最高的 k 个网格"""
+    index = scoring.rank_top_k(overall, k)
+    lat, lon = grid.centers_of(index)
+    cells_df = scoring.scores_frame(np.arange(grid.size), matrix, overall, index)
+    cells_df = cells_df.rename(columns={"位置名称": "网格编号"})
+    cells_df.insert(1, "纬度", lat)
+    cells_df.insert(2, "经度", lon)
+    cells_df.insert(0, "排名", np.arange(1, len(index) + 1))
+    return cells_df
@@ -0,0 +1,151 @@
+"""分阶段耗时与内存统计
+
+页面各阶段 (读取、校验、评分、聚类、图表、表格渲染等) 用 Profiler.stage 包裹，记录耗时、
+进程常驻内存 (RSS) 变化，开启内存跟踪时还记录 tracemalloc 统计的峰值增量。每个阶段结束时
+以 JSON 格式写一行日志，并可在侧边栏的性能诊断面板中查看。
+
+未启用时 stage 直接返回同一个空上下文，不读取时钟和内存，可以在生产环境中常驻代码。
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+import weakref
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 设置该环境变量为 1 时默认启用统计 (只写日志，不必打开诊断面板)
+ENV_VARIABLE = "SITE_SELECTION_PROFILE"
+FRAME_COLUMNS = ["阶段", "耗时(毫秒)", "RSS变化(MB)", "峰值增量(MB)", "行数"]
+
+_NULL_STAGE = contextlib.nullcontext()
+_MB = 1024 ** 2
+# tracemalloc 是进程级的，而开关属于各会话：统计正在跟踪内存的 Profiler 数量，
+# 最后一个结束时才关闭；由本模块开启的 tracemalloc 才由本模块关闭
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started = False
+
+
+def configure_logging(stream=None):
+    """把阶段日志按每行一个 JSON 对象输出到 stream (默认标准错误)，重复调用不会重复添加"""
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def enabled_by_env():
+    return os.environ.get(ENV_VARIABLE, "") == "1"
+
+
+def current_rss():
+    """当前进程的常驻内存 (字节)，无法读取时为 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def acquire_memory_tracing():
+    """登记一个需要跟踪内存的使用者，必要时开启 tracemalloc (开启后 Python 内存分配明显变慢，只在排查问题时使用)"""
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_users += 1
+
+
+def release_memory_tracing():
+    """注销一个使用者，没有使用者时关闭由本模块开启的 tracemalloc"""
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users = max(_tracing_users - 1, 0)
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+class Profiler:
+    """记录一次页面运行中各阶段的耗时与内存变化
+
+    开启内存跟踪时，运行结束后应调用 close() 注销；未调用时在对象被回收时注销。
+    """
+
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.run_id = uuid.uuid4().hex[:12] if enabled else None
+        self.records = []
+        self._stack = []
+        self._release = None
+        if enabled:
+            configure_logging()
+        if self.trace_memory:
+            acquire_memory_tracing()
+            self._release = weakref.finalize(self, release_memory_tracing)
+
+    def close(self):
+        """注销内存跟踪 (可重复调用)"""
+        if self._release is not None:
+            self._release()
+
+    def stage(self, name, rows=None):
+        """包裹一个阶段，可嵌套 (记录的阶段名以 / 连接上层阶段)；rows 为处理的行数"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._measure(name, rows)
+
+    @contextlib.contextmanager
+    def _measure(self, name, rows):
+        path = "/".join([entry["name"] for entry in self._stack] + [name])
+        entry = {"name": name, "peak": 0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # 上层阶段到目前为止的峰值先记下，再为本阶段重新计峰值
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            entry["traced"] = current
+        self._stack.append(entry)
+        rss = current_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            end_rss = current_rss()
+            self._stack.pop()
+            peak_increase = None
+            if self.trace_memory:
+                peak = max(entry["peak"], tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+                peak_increase = (peak - entry["traced"]) / _MB
+            record = {
+                "stage": path,
+                "seconds": seconds,
+                "rss_delta_mb": None if rss is None or end_rss is None else (end_rss - rss) / _MB,
+                "peak_increase_mb": peak_increase,
+                "rows": rows,
+            }
+            self.records.append(record)
+            logger.info(json.dumps({"event": "stage", "run": self.run_id, **record}, ensure_ascii=False))
+
+    def frame(self):
+        """各阶段的统计表 (按结束顺序)"""
+        return pd.DataFrame([
+            [record["stage"], record["seconds"] * 1000, record["rss_delta_mb"], record["peak_increase_mb"],
+             record["rows"]]
+            for record in self.records
+        ], columns=FRAME_COLUMNS).astype({"RSS变化(MB)": float, "峰值增量(MB)": float, "行数": "Int64"})
@@ -1,22 +1,207 @@
+import contextlib
+import hashlib
+from datetime import date, timedelta
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.cluster import KMeans
 
-# 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei']  # 用来正常显示中文标签
-plt.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
+import cache
+import clustering
+import export
+import grid
+import instrumentation
+import plotting
+import portfolio
+import roi
+import schema
+import scoring
+import sensitivity
+import similarity
+import spatial
+import store
+import traffic
+import validation
 
 # 初始化应用
 st.set_page_config(page_title="门店选址评估模型", layout="wide")
 st.title("门店选址评估模型")
 st.write("通过多维度分析，帮助您评估潜在的门店位置")
 
+
+# 上传文件按内容哈希缓存，调整权重时无需重新读取和评分
+def file_digest(uploaded_file):
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+
+# 结果保存在进程内所有会话共享的缓存中，多人上传同一文件、执行相同分析时直接复用；
+# 缓存按内存预算淘汰最久未使用的结果
+def shared_cache(spinner=None):
+    return cache.memoize(cache.default_cache(), on_miss=(lambda: st.spinner(spinner)) if spinner else None)
+
+
+@shared_cache()
+def load_excel_sheets(digest, _uploaded_file):
+    return schema.excel_sheets(_uploaded_file.getvalue())
+
+
+def select_sheet(uploaded_file, digest, key):
+    # Excel 工作簿有多个工作表时选择要分析的工作表，其他格式返回 None
+    if schema.table_format(uploaded_file.name) != "xlsx":
+        return None
+    sheets = load_excel_sheets(digest, uploaded_file)
+    if len(sheets) <= 1:
+        return sheets[0] if sheets else None
+    return st.selectbox("选择工作表", sheets, key=key)
+
+
+@shared_cache("正在读取数据...")
+def load_uploaded_table(digest, _uploaded_file, schema_name, sheet=None):
+    return schema.read_table(_uploaded_file.getvalue(), _uploaded_file.name, getattr(schema, schema_name), sheet)
+
+
+@shared_cache("正在校验数据...")
+def validate_upload(digest, _df, rules_name, required=(), schema_name=None):
+    return validation.validate(_df, getattr(validation, rules_name), required,
+                               getattr(schema, schema_name) if schema_name else None)
+
+
+def _build_export(data, fmt):
+    with st.spinner("正在生成导出文件..."):
+        return export.export_table(data() if callable(data) else data, fmt)
+
+
+def _session_export(label, base_name, key, data, fmt):
+    # 点击按钮后才生成导出文件；文件只保留在本会话中 (较大时转存磁盘)，数据或格式变化后丢弃
+    exports = st.session_state.setdefault("exports", {})
+    entry = exports.get(base_name)
+    if entry is not None and entry[0] != (key, fmt):
+        exports.pop(base_name)[1].close()
+        entry = None
+    if entry is None:
+        if not st.button(label.replace("下载", "生成", 1) + "文件", key=f"export_{base_name}"):
+            return None
+        entry = exports[base_name] = ((key, fmt), _build_export(data, fmt))
+    return entry[1]
+
+
+def download_table(label, base_name, key, data, on_demand=True):
+    # 按侧边栏选择的格式导出，data 为 DataFrame 或返回分块迭代器的函数。大表导出较慢，
+    # 默认按需生成 (不随页面重新运行重复生成，也不放入共享缓存)；on_demand 为 False 时直接生成
+    fmt = export.FORMATS[st.session_state.get("export_format", "CSV")]
+    if on_demand:
+        file = _session_export(label, base_name, key, data, fmt)
+        if file is None:
+            return
+        file.seek(0)
+        content = file.read()
+    else:
+        with _build_export(data, fmt) as file:
+            content = file.read()
+    st.download_button(
+        label=label,
+        data=content,
+        file_name=f"{base_name}.{fmt}",
+        mime=export.MIME_TYPES[fmt]
+    )
+
+
+def show_quarantine(result, base_name, digest):
+    # 提示修正和隔离的情况，并提供隔离行下载
+    if result.coerced:
+        st.info(f"已自动修正 {result.coerced:,} 个单元格 (如去掉数字中的千分位逗号和空白)")
+    if len(result.quarantine):
+        st.warning(f"{len(result.quarantine):,} 行数据未通过校验，已移入隔离表，其余 {len(result.clean):,} 行正常分析")
+        download_table("下载未通过校验的数据", base_name, ("quarantine", base_name, digest), result.quarantine)
+
+
+@shared_cache("正在计算各维度得分...")
+def load_score_matrix(digest, _df):
+    return scoring.compute_dimension_scores(_df)
+
+
+@shared_cache("正在建立空间索引...")
+def load_point_index(digest, _uploaded_file, value_column=None):
+    # 返回空间索引和未通过校验 (经纬度缺失或超出范围等) 而被剔除的点位数
+    poi = schema.read_table(_uploaded_file.getvalue(), _uploaded_file.name, schema.POI_SCHEMA)
+    required = ["纬度", "经度"] + ([value_column] if value_column else [])
+    missing_columns = [col for col in required if col not in poi.columns]
+    if missing_columns:
+        raise ValueError(f"点位数据缺少必要的列: {', '.join(missing_columns)}")
+    validated = validation.validate(poi, validation.POI_RULES, required, schema.POI_SCHEMA)
+    if validated.clean.empty:
+        raise ValueError("没有经纬度有效的点位")
+    return spatial.index_points(validated.clean, value_column), len(validated.quarantine)
+
+
+@shared_cache("正在聚合人流量时序...")
+def load_traffic_metrics(digest, holiday_text, _uploaded_file):
+    holidays = traffic.parse_holidays(holiday_text.splitlines())
+    return traffic.load_metrics(_uploaded_file.getvalue(), _uploaded_file.name, holidays)
+
+
+@shared_cache("正在计算竞争特征...")
+def derive_competition(digest, poi_digest, radius, _df, _index):
+    return spatial.competition_features(_df, _index, radius)
+
+
+@shared_cache("正在进行权重敏感性分析...")
+def run_sensitivity(digest, weights, n_samples, concentration, k, _matrix):
+    weight_samples = sensitivity.sample_weights(weights, n_samples, concentration)
+    return sensitivity.rank_probabilities(_matrix, weight_samples, k)
+
+
+@shared_cache("正在模拟投资回报...")
+def run_roi_simulation(digest, assumptions, n_simulations, _df):
+    daily_traffic = scoring.avg_daily_traffic(*(_df[name].to_numpy(dtype=np.float64)
+                                                for name in ["早高峰人流量", "午高峰人流量", "晚高峰人流量"]))
+    return roi.simulate_roi(daily_traffic, _df["月租金"].to_numpy(dtype=np.float64),
+                            _df["店铺面积"].to_numpy(dtype=np.float64), assumptions, n_simulations)
+
+
+@shared_cache("正在生成优劣势报告...")
+def build_strengths_report(digest, weights, _names, _matrix, _overall):
+    return scoring.strengths_report(_names, _matrix, _overall)
+
+
+@shared_cache("正在计算开店组合...")
+def run_portfolio(digest, weights, k, budget, radius, penalty, _df, _overall):
+    # 有经纬度时按分流半径建立空间索引，结果按文件、权重和组合参数缓存
+    has_coordinates = {"纬度", "经度"} <= set(_df.columns)
+    return portfolio.select_portfolio(
+        _overall, k, _df["月租金"].to_numpy(), budget or None,
+        _df["纬度"].to_numpy() if has_coordinates else None,
+        _df["经度"].to_numpy() if has_coordinates else None,
+        radius, penalty)
+
+
+@shared_cache("正在计算网格得分...")
+def score_city_grid(layer_digests, city_grid, city_level, radius, _layers):
+    return grid.score_grid(city_grid, _layers, city_level, radius)
+
+
+@shared_cache("正在执行聚类分析...")
+def run_clustering(digest, features, n_clusters, engine, _df):
+    # 两种引擎都使用已校验的数据 (MiniBatchKMeans 逐块 partial_fit)，聚类标签与数据行一一对应
+    features = list(features)
+    return clustering.fit_clusters(clustering.frame_chunks(_df, features), features, n_clusters, engine)
+
+
+@shared_cache("正在扫描K值...")
+def run_k_sweep(digest, features, k_range, engine, _df):
+    features = list(features)
+    return clustering.sweep_k(clustering.frame_chunks(_df, features),
+                              range(k_range[0], k_range[1] + 1), engine)
+
+
+# 渲染后的图表按数据内容缓存，重复渲染时直接复用PNG
+@shared_cache()
+def cached_chart(key, _render):
+    return _render()
+
+
 # 创建标签页
-tab1, tab2, tab3 = st.tabs(["单店评估", "多店对比", "数据分析"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["单店评估", "多店对比", "数据分析", "城市网格扫描", "历史记录"])
 
 # 评估维度权重设置
 with st.sidebar:
@@ -50,6 +235,40 @@ with st.sidebar:
         amenities_weight *= scale_factor
         transportation_weight *= scale_factor
         target_match_weight *= scale_factor
+    
+    weights = [foot_traffic_weight, rent_weight, competition_weight,
+               amenities_weight, transportation_weight, target_match_weight]
+    
+    # 投资回报模拟假设 (三角分布: 最小值、最可能值、最大值)
+    with st.expander("投资回报模拟假设"):
+        roi_defaults = roi.ROIAssumptions()
+        roi_inputs = {}
+        for field, label, step in [("conversion", "消费转化率", 0.01), ("ticket", "客单价 (元)", 5.0),
+                                   ("gross_margin", "毛利率", 0.05), ("fitout_per_sqm", "装修成本 (元/平方米)", 100.0)]:
+            st.write(label)
+            low, mode, high = getattr(roi_defaults, field)
+            col1, col2, col3 = st.columns(3)
+            values = (col1.number_input("最小", 0.0, None, float(low), step, key=f"roi_{field}_low"),
+                      col2.number_input("最可能", 0.0, None, float(mode), step, key=f"roi_{field}_mode"),
+                      col3.number_input("最大", 0.0, None, float(high), step, key=f"roi_{field}_high"))
+            roi_inputs[field] = tuple(sorted(values))
+        roi_assumptions = roi.ROIAssumptions(**roi_inputs)
+        n_simulations = st.number_input("模拟次数", 100, 10000, roi.DEFAULT_SIMULATIONS, 100)
+    
+    # 结果下载使用的文件格式
+    st.selectbox("导出文件格式", list(export.FORMATS), key="export_format",
+                 help="CSV 可直接用 Excel 打开；Parquet 适合大数据量；Excel 单个工作表超过约104万行时续写到新工作表")
+    
+    # 性能诊断: 记录各阶段耗时与内存变化，未开启时几乎没有额外开销
+    with st.expander("性能诊断"):
+        profiling_enabled = st.checkbox("记录各阶段耗时与内存", instrumentation.enabled_by_env(),
+                                        help="同时以 JSON 格式写入日志 (标准错误输出)")
+        trace_memory = st.checkbox("跟踪Python内存分配", help="统计各阶段的峰值内存增量，开启后运行会变慢",
+                                   disabled=not profiling_enabled)
+        diagnostics_panel = st.container()
+        if st.button("清空共享缓存", help="所有会话共享的已读取数据、评分、聚类结果和图表"):
+            cache.default_cache().clear()
+    profiler = instrumentation.Profiler(profiling_enabled, trace_memory)
 
 # 单店评估标签页
 with tab1:
@@ -67,7 +286,7 @@ with tab1:
         
         with col2:
             city_level = st.selectbox("城市等级", ["一线城市", "二线城市", "三线城市", "四线及以下城市"])
-            business_district = st.selectbox("商圈类型", ["核心商圈", "区域商圈", "社区商圈", "特色商圈"])
+            business_district = st.selectbox("商圈类型", scoring.DISTRICT_TYPES)
             lease_years = st.number_input("租赁年限", 1, 20, 3)
         
         st.subheader("人流量数据")
@@ -102,12 +321,12 @@ with tab1:
         col7, col8 = st.columns(2)
         
         with col7:
-            transportation_score = st.slider("交通便利性", 0, 10, 7)
+            transportation_input = st.slider("交通便利性", 0, 10, 7)
             parking_spots = st.number_input("附近停车位数量", 0, 500, 50)
             public_transit_count = st.number_input("附近公交/地铁站数量", 0, 20, 3)
         
         with col8:
-            amenities_score = st.slider("周边配套完善度", 0, 10, 8)
+            amenities_input = st.slider("周边配套完善度", 0, 10, 8)
             residential_density = st.slider("周边住宅密度", 0, 10, 6)
             commercial_density = st.slider("周边商业密度", 0, 10, 7)
         
@@ -122,75 +341,56 @@ with tab1:
             income_level_match = st.slider("收入水平匹配度", 0, 10, 6)
             consumer_behavior_match = st.slider("消费习惯匹配度", 0, 10, 7)
         
+        st.subheader("相似历史位置")
+        col11, col12 = st.columns(2)
+        with col11:
+            similar_k = st.number_input("显示最相似的位置数量", 1, 50, similarity.DEFAULT_TOP_K)
+        with col12:
+            similar_mode = st.radio("搜索方式", list(similarity.SEARCH_MODES), horizontal=True)
+        
         # 提交按钮
         submitted = st.form_submit_button("评估选址")
     
     # 处理表单提交
     if submitted:
-        # 计算各维度得分
+        # 计算各维度得分 (与多店对比共用评分公式)
         # 1. 人流量得分 (越高越好)
-        avg_daily_traffic = (morning_traffic + afternoon_traffic + evening_traffic * 2) / 4
-        foot_traffic_score = min(100, (avg_daily_traffic / 100))  # 转换为0-100分
+        avg_daily_traffic = scoring.avg_daily_traffic(morning_traffic, afternoon_traffic, evening_traffic)
+        foot_traffic_score = scoring.foot_traffic_score(morning_traffic, afternoon_traffic, evening_traffic,
+                                                        weekend_traffic, holiday_traffic)
         
         # 2. 租金成本得分 (租金与面积的比率，越低越好，转换为得分)
         rent_per_sqm = rent_cost / area_size
-        # 根据城市等级设置不同的租金评分标准
-        city_rent_standards = {
-            "一线城市": 500,
-            "二线城市": 300,
-            "三线城市": 200,
-            "四线及以下城市": 100
-        }
-        standard_rent = city_rent_standards[city_level]
-        rent_score = max(0, 100 - ((rent_per_sqm - standard_rent) / standard_rent) * 100)
-        rent_score = min(100, rent_score)
+        rent_score = scoring.rent_score(rent_cost, area_size, scoring.city_rent_standard(city_level))
         
         # 3. 竞争情况得分 (竞争对手越少、距离越远、市场饱和度越低、竞争优势越高越好)
-        competition_score = (
-            (10 - competitor_count) * 5 +  # 竞争对手数量 (反向计分)
-            min(100, competitor_distance / 10) * 0.2 +  # 最近竞争对手距离
-            (100 - market_saturation) * 0.3 +  # 市场饱和度 (反向计分)
-            competitive_advantage * 0.2  # 竞争优势
-        )
-        competition_score = min(100, competition_score)
+        competition_score = scoring.competition_score(
+            competitor_count, competitor_distance, market_saturation, competitive_advantage)
         
         # 4. 周边配套得分
-        amenities_score = (
-            amenities_score * 10 +  # 周边配套完善度
-            residential_density * 5 +  # 周边住宅密度
-            commercial_density * 5  # 周边商业密度
-        )
+        amenities_score = scoring.amenities_score(amenities_input, residential_density, commercial_density)
         
         # 5. 交通便利性得分
-        transportation_score = (
-            transportation_score * 7 +  # 交通便利性
-            min(100, parking_spots) * 0.2 +  # 附近停车位数量
-            public_transit_count * 5  # 附近公交/地铁站数量
-        )
-        transportation_score = min(100, transportation_score)
+        transportation_score = scoring.transportation_score(
+            transportation_input, parking_spots, public_transit_count)
         
         # 6. 目标客群匹配度得分
-        target_match_score = (
-            target_demographic_match * 25 +
-            age_group_match * 25 +
-            income_level_match * 25 +
-            consumer_behavior_match * 25
-        )
+        target_match_score = scoring.target_match_score(
+            target_demographic_match, age_group_match, income_level_match, consumer_behavior_match)
         
         # 计算加权综合得分
-        overall_score = (
-            foot_traffic_score * foot_traffic_weight +
-            rent_score * rent_weight +
-            competition_score * competition_weight +
-            amenities_score * amenities_weight +
-            transportation_score * transportation_weight +
-            target_match_score * target_match_weight
-        )
+        overall_score = float(np.dot([
+            foot_traffic_score,
+            rent_score,
+            competition_score,
+            amenities_score,
+            transportation_score,
+            target_match_score
+        ], scoring.normalize_weights(weights)))
         
-        # 计算投资回报预期 (简化计算)
-        estimated_monthly_revenue = avg_daily_traffic * 0.1 * 30  # 假设10%的人流量会消费，平均消费100元
-        monthly_profit = estimated_monthly_revenue - rent_cost
-        roi_months = max(0, (area_size * 2000) / monthly_profit) if monthly_profit > 0 else float('inf')  # 假设装修成本为2000元/平方米
+        # 投资回报蒙特卡洛模拟
+        with profiler.stage("单店评估/投资回报模拟"):
+            roi_result = roi.simulate_roi(avg_daily_traffic, rent_cost, area_size, roi_assumptions, n_simulations)
         
         # 显示评估结果
         st.subheader("选址评估结果")
@@ -213,52 +413,33 @@ with tab1:
         with col2:
             # 投资回报分析
             st.write("**投资回报分析**:")
-            st.write(f"预估月收入: ¥{estimated_monthly_revenue:,.0f}")
+            st.write(f"预估月收入: ¥{roi_result.expected_revenue[0]:,.0f}")
             st.write(f"月租金成本: ¥{rent_cost:,.0f}")
-            st.write(f"预估月利润: ¥{monthly_profit:,.0f}")
-            if roi_months != float('inf'):
-                st.write(f"预计回本周期: {roi_months:.1f} 个月")
-            else:
+            st.write(f"预估月利润: ¥{roi_result.expected_profit[0]:,.0f}")
+            payback = dict(zip(roi.PAYBACK_PERCENTILES, roi_result.payback[0]))
+            if np.isfinite(payback[50]):
+                st.write(f"预计回本周期: {payback[50]:.1f} 个月 "
+                         f"(乐观 {payback[10]:.1f} / 保守 {'无法回本' if np.isinf(payback[90]) else f'{payback[90]:.1f} 个月'})")
+            st.write(f"亏损概率: {roi_result.loss_probability[0]:.1%}")
+            if roi_result.loss_probability[0] >= 0.5:
                 st.error("根据当前数据，该位置预计会亏损")
         
         # 创建雷达图展示各维度得分
         st.subheader("各维度得分")
         
-        # 准备雷达图数据
-        categories = ['人流量', '租金成本', '竞争情况', '周边配套', '交通便利性', '客群匹配度']
-        values = [
+        # 雷达图按各维度得分缓存
+        values = (
             foot_traffic_score,
             rent_score,
             competition_score,
             amenities_score,
             transportation_score,
             target_match_score
-        ]
-        
-        # 计算雷达图角度
-        N = len(categories)
-        angles = [n / float(N) * 2 * np.pi for n in range(N)]
-        angles += angles[:1]  # 闭合雷达图
-        values += values[:1]  # 闭合雷达图
-        
-        # 创建雷达图
-        fig, ax = plt.subplots(figsize=(8, 8), subplot_kw=dict(polar=True))
-        
-        # 绘制雷达图
-        ax.plot(angles, values, linewidth=2, linestyle='solid')
-        ax.fill(angles, values, alpha=0.25)
-        
-        # 设置雷达图标签
-        plt.xticks(angles[:-1], categories)
-        
-        # 设置y轴范围
-        ax.set_ylim(0, 100)
-        
-        # 添加标题
-        plt.title(f"{location_name} 各维度得分雷达图", size=15, y=1.1)
-        
-        # 显示雷达图
-        st.pyplot(fig)
+        )
+        title = f"{location_name} 各维度得分雷达图"
+        with profiler.stage("单店评估/雷达图"):
+            st.image(cached_chart(("radar", title, tuple(float(v) for v in values)),
+                                  lambda: plotting.radar_chart(scoring.CATEGORIES, [(location_name, values)], title)))
         
         # 显示各维度详细得分
         st.subheader("维度详细分析")
@@ -279,6 +460,34 @@ with tab1:
         st.write(f"店铺面积: {area_size} 平方米")
         st.write(f"每平米租金: ¥{rent_per_sqm:.1f}")
         
+        # 在聚类分析的标准化特征空间中查找相似的历史位置
+        st.subheader("相似历史位置")
+        site_index = st.session_state.get("site_index")
+        if site_index is None:
+            st.info('请先在"数据分析"标签页执行聚类分析，建立历史位置索引后即可查找相似位置')
+        else:
+            # 表单字段与聚类特征列的对应关系
+            form_values = {
+                "人流量": avg_daily_traffic, "每平米租金": rent_per_sqm, "店铺面积": area_size,
+                "月租金": rent_cost, "早高峰人流量": morning_traffic, "午高峰人流量": afternoon_traffic,
+                "晚高峰人流量": evening_traffic, "周末人流量": weekend_traffic, "节假日人流量": holiday_traffic,
+                "竞争对手数量": competitor_count, "最近竞争对手距离": competitor_distance,
+                "市场饱和度": market_saturation, "竞争优势评估": competitive_advantage,
+                "交通便利性": transportation_input, "周边配套完善度": amenities_input,
+                "停车位数量": parking_spots, "公交地铁站数量": public_transit_count,
+                "周边住宅密度": residential_density, "周边商业密度": commercial_density,
+            }
+            missing_features = [name for name in site_index.features if name not in form_values]
+            if missing_features:
+                st.warning(f"聚类特征 {', '.join(missing_features)} 无法由表单取得，无法查找相似位置")
+            else:
+                with profiler.stage("单店评估/相似位置搜索"):
+                    similar_df = site_index.similar_sites(form_values, similar_k,
+                                                          similarity.SEARCH_MODES[similar_mode])
+                    st.dataframe(similar_df, hide_index=True)
+                st.caption(f"在 {len(site_index):,} 个历史位置中按 {', '.join(site_index.features)} "
+                           f"的标准化距离搜索")
+        
         # 生成建议
         st.subheader("选址建议")
         
@@ -315,7 +524,16 @@ with tab2:
             "市场饱和度": [60, 50, 40],
             "竞争优势评估": [70, 65, 60],
             "交通便利性": [8, 7, 6],
-            "周边配套完善度": [9, 7, 6]
+            "周边配套完善度": [9, 7, 6],
+            # 以下为可选列，缺失时按单店评估表单的默认值计算
+            "停车位数量": [80, 50, 30],
+            "公交地铁站数量": [5, 3, 2],
+            "周边住宅密度": [6, 7, 8],
+            "周边商业密度": [9, 7, 5],
+            "目标人群匹配度": [8, 7, 6],
+            "年龄结构匹配度": [7, 7, 6],
+            "收入水平匹配度": [8, 6, 5],
+            "消费习惯匹配度": [7, 7, 6]
         }
         
         example_df = pd.DataFrame(example_data)
@@ -328,211 +546,229 @@ with tab2:
         )
     
     # 文件上传
-    uploaded_file = st.file_uploader("上传包含多个位置数据的CSV文件", type="csv")
+    uploaded_file = st.file_uploader("上传包含多个位置数据的文件 (CSV/Excel/Parquet/Arrow)",
+                                     type=schema.SUPPORTED_TYPES)
     
     if uploaded_file is not None:
         # 读取数据
         try:
-            df = pd.read_csv(uploaded_file)
+            digest = file_digest(uploaded_file)
+            sheet = select_sheet(uploaded_file, digest, "comparison_sheet")
+            with profiler.stage("多店对比/读取"):
+                df = load_uploaded_table(digest, uploaded_file, "COMPARISON_SCHEMA", sheet)
+            if sheet is not None:
+                # 同一工作簿的不同工作表分别缓存校验、评分等结果
+                digest = f"{digest}:{sheet}"
             st.success("数据上传成功！")
             
+            # 校验类型、取值范围和枚举值，问题行隔离后其余行照常评分
+            with profiler.stage("多店对比/校验", len(df)):
+                validated = validate_upload(digest, df, "COMPARISON_RULES", schema_name="COMPARISON_SCHEMA")
+            show_quarantine(validated, "多店对比数据_未通过校验", digest)
+            df = validated.clean
+            
             # 显示数据预览
             st.subheader("数据预览")
             st.dataframe(df.head())
             
-            # 验证数据格式
-            required_columns = ["位置名称", "城市等级", "商圈类型", "店铺面积", "月租金",
-                               "早高峰人流量", "午高峰人流量", "晚高峰人流量", "周末人流量",
-                               "节假日人流量", "竞争对手数量", "最近竞争对手距离", "市场饱和度",
-                               "竞争优势评估", "交通便利性", "周边配套完善度"]
+            # 可选: 根据竞争对手点位批量计算竞争对手数量和最近竞争对手距离
+            with st.expander("根据竞争对手/POI点位计算竞争特征"):
+                poi_file = st.file_uploader("上传竞争对手/POI点位数据 (需包含纬度、经度列)",
+                                            type=schema.SUPPORTED_TYPES)
+                competitor_radius = st.number_input("竞争对手统计半径 (米)", 50, 5000,
+                                                    spatial.DEFAULT_COMPETITOR_RADIUS, 50)
+            if poi_file is not None:
+                if not {"纬度", "经度"} <= set(df.columns):
+                    st.warning("候选位置数据缺少纬度、经度列，无法根据点位计算竞争特征")
+                else:
+                    poi_digest = file_digest(poi_file)
+                    with profiler.stage("多店对比/竞争特征", len(df)):
+                        poi_index, poi_dropped = load_point_index(poi_digest, poi_file)
+                        df = derive_competition(digest, poi_digest, competitor_radius, df, poi_index)
+                    digest = f"{digest}:{poi_digest}:{competitor_radius}"
+                    st.info(f"已根据 {poi_index.size:,} 个竞争对手点位计算竞争对手数量和最近竞争对手距离")
+                    if poi_dropped:
+                        st.warning(f"{poi_dropped:,} 个点位的经纬度缺失或超出范围，未参与计算")
+            
+            # 可选: 根据逐小时人流量时序计算各时段平均人流量
+            with st.expander("根据逐小时人流量数据计算人流量指标"):
+                traffic_file = st.file_uploader("上传逐小时人流量数据 (位置名称、时间、人流量列) 或已聚合的人流量指标",
+                                                type=schema.SUPPORTED_TYPES)
+                holiday_text = st.text_area("节假日日期 (每行一个，如 2024-10-01)")
+            if traffic_file is not None:
+                traffic_digest = file_digest(traffic_file)
+                holiday_digest = hashlib.sha256(holiday_text.encode()).hexdigest()
+                with profiler.stage("多店对比/人流量时序", len(df)):
+                    traffic_metrics = load_traffic_metrics(traffic_digest + holiday_digest, holiday_text, traffic_file)
+                    df = traffic.apply_metrics(df, traffic_metrics)
+                digest = f"{digest}:{traffic_digest}:{holiday_digest}"
+                matched = int(df["位置名称"].isin(traffic_metrics.index).sum())
+                st.info(f"已根据时序数据更新 {matched:,} 个位置的早/午/晚高峰、周末及节假日人流量")
             
-            missing_columns = [col for col in required_columns if col not in df.columns]
+            # 验证数据格式
+            missing_columns = [col for col in scoring.REQUIRED_COLUMNS if col not in df.columns]
             if missing_columns:
                 st.error(f"数据缺少必要的列: {', '.join(missing_columns)}")
             else:
-                # 计算各位置的评分
-                scores = []
-                
-                for _, row in df.iterrows():
-                    # 计算各维度得分 (类似单店评估的逻辑)
-                    # 1. 人流量得分
-                    avg_daily_traffic = (row["早高峰人流量"] + row["午高峰人流量"] + row["晚高峰人流量"] * 2) / 4
-                    foot_traffic_score = min(100, (avg_daily_traffic / 100))
-                    
-                    # 2. 租金成本得分
-                    rent_per_sqm = row["月租金"] / row["店铺面积"]
-                    city_rent_standards = {
-                        "一线城市": 500,
-                        "二线城市": 300,
-                        "三线城市": 200,
-                        "四线及以下城市": 100
-                    }
-                    standard_rent = city_rent_standards.get(row["城市等级"], 200)
-                    rent_score = max(0, 100 - ((rent_per_sqm - standard_rent) / standard_rent) * 100)
-                    rent_score = min(100, rent_score)
-                    
-                    # 3. 竞争情况得分
-                    competition_score = (
-                        (10 - row["竞争对手数量"]) * 5 +
-                        min(100, row["最近竞争对手距离"] / 10) * 0.2 +
-                        (100 - row["市场饱和度"]) * 0.3 +
-                        row["竞争优势评估"] * 0.2
-                    )
-                    competition_score = min(100, competition_score)
-                    
-                    # 4. 周边配套得分 (简化)
-                    amenities_score = row["周边配套完善度"] * 10
-                    
-                    # 5. 交通便利性得分
-                    transportation_score = row["交通便利性"] * 10
-                    
-                    # 6. 目标客群匹配度得分 (假设默认为70，实际应用中应从数据中读取)
-                    target_match_score = 70
-                    
-                    # 计算加权综合得分
-                    overall_score = (
-                        foot_traffic_score * foot_traffic_weight +
-                        rent_score * rent_weight +
-                        competition_score * competition_weight +
-                        amenities_score * amenities_weight +
-                        transportation_score * transportation_weight +
-                        target_match_score * target_match_weight
-                    )
-                    
-                    scores.append({
-                        "位置名称": row["位置名称"],
-                        "综合评分": overall_score,
-                        "人流量得分": foot_traffic_score,
-                        "租金成本得分": rent_score,
-                        "竞争情况得分": competition_score,
-                        "周边配套得分": amenities_score,
-                        "交通便利性得分": transportation_score,
-                        "目标客群匹配度得分": target_match_score
-                    })
-                
-                # 创建评分结果数据框
-                scores_df = pd.DataFrame(scores)
-                scores_df = scores_df.sort_values("综合评分", ascending=False)
+                # 按整列计算各位置的评分 (与单店评估使用相同公式)
+                # 得分矩阵按文件缓存，权重变化时只需一次矩阵乘法和前K名排序
+                with profiler.stage("多店对比/评分", len(df)):
+                    score_matrix = load_score_matrix(digest, df)
+                    overall_scores = scoring.weighted_scores(score_matrix, weights)
+                top_k = st.number_input("显示排名前K个位置", 1, len(df), min(len(df), 100))
+                with profiler.stage("多店对比/排名", len(df)):
+                    scores_df = scoring.scores_frame(df["位置名称"], score_matrix, overall_scores,
+                                                     scoring.rank_top_k(overall_scores, top_k))
+                    worst_index = scoring.rank_top_k(-overall_scores, 1)
                 
                 # 显示评分结果
                 st.subheader("选址对比结果")
-                st.dataframe(scores_df.style.highlight_max(subset="综合评分", color="yellow"))
+                with profiler.stage("多店对比/结果表格", len(scores_df)):
+                    st.dataframe(scores_df.style.highlight_max(subset="综合评分", color="yellow"))
+                
+                # 全部位置的评分按排名分块导出，不必先组装完整的结果表
+                def score_chunks():
+                    ranked = scoring.rank_top_k(overall_scores, None)
+                    for start in range(0, len(ranked), export.DEFAULT_CHUNKSIZE):
+                        yield scoring.scores_frame(df["位置名称"], score_matrix, overall_scores,
+                                                   ranked[start:start + export.DEFAULT_CHUNKSIZE])
+                with profiler.stage("多店对比/导出", len(df)):
+                    download_table("下载全部位置评分结果", "选址对比评分结果", ("scores", digest, tuple(weights)),
+                                   score_chunks)
+                
+                # 保存本次评分结果，之后可在"历史记录"中直接查询
+                if st.button("保存本次评估结果到历史记录"):
+                    with st.spinner("正在保存评估结果..."), contextlib.closing(store.connect()) as conn:
+                        analysis_id = store.save_analysis(conn, df, score_matrix, overall_scores, weights,
+                                                          uploaded_file.name)
+                    st.success(f"已保存 {len(df):,} 个位置的评估结果 (分析编号 {analysis_id})")
                 
                 # 可视化对比
                 st.subheader("可视化对比")
                 
                 # 综合评分柱状图
                 st.write("**综合评分对比**")
-                fig, ax = plt.subplots(figsize=(10, 6))
-                bars = ax.bar(scores_df["位置名称"], scores_df["综合评分"])
-                ax.set_ylim(0, 100)
-                ax.set_xlabel("位置")
-                ax.set_ylabel("综合评分")
-                ax.set_title("各位置综合评分对比")
-                
-                # 添加数值标签
-                for bar in bars:
-                    height = bar.get_height()
-                    ax.text(bar.get_x() + bar.get_width()/2., height + 1,
-                            f'{height:.1f}', ha='center', va='bottom')
+                bar_top_n = st.slider("柱状图显示前N个位置", 1, min(len(scores_df), plotting.BAR_CHART_MAX),
+                                      min(len(scores_df), 20))
+                chart_key = (digest, tuple(weights), top_k)
+                with profiler.stage("多店对比/柱状图"):
+                    st.image(cached_chart(("bar", bar_top_n) + chart_key,
+                                          lambda: plotting.score_bar_chart(scores_df["位置名称"].to_numpy(),
+                                                                           scores_df["综合评分"].to_numpy(), bar_top_n)))
                 
-                plt.tight_layout()
-                st.pyplot(fig)
-                
-                # 各维度对比雷达图
+                # 各维度对比雷达图 (选择前3个位置)
                 st.write("**各维度得分对比雷达图**")
-                
-                # 选择前3个位置进行雷达图对比
                 top_locations = scores_df.head(3)
-                
-                # 准备雷达图数据
-                categories = ['人流量', '租金成本', '竞争情况', '周边配套', '交通便利性', '客群匹配度']
-                
-                # 计算雷达图角度
-                N = len(categories)
-                angles = [n / float(N) * 2 * np.pi for n in range(N)]
-                angles += angles[:1]  # 闭合雷达图
-                
-                # 创建雷达图
-                fig, ax = plt.subplots(figsize=(10, 10), subplot_kw=dict(polar=True))
-                
-                # 为每个位置绘制雷达图
-                colors = ['blue', 'red', 'green']
-                for i, (_, row) in enumerate(top_locations.iterrows()):
-                    values = [
-                        row["人流量得分"],
-                        row["租金成本得分"],
-                        row["竞争情况得分"],
-                        row["周边配套得分"],
-                        row["交通便利性得分"],
-                        row["目标客群匹配度得分"]
-                    ]
-                    values += values[:1]  # 闭合雷达图
-                    
-                    ax.plot(angles, values, linewidth=2, linestyle='solid', color=colors[i], label=row["位置名称"])
-                    ax.fill(angles, values, alpha=0.1, color=colors[i])
-                
-                # 设置雷达图标签
-                plt.xticks(angles[:-1], categories)
-                
-                # 设置y轴范围
-                ax.set_ylim(0, 100)
-                
-                # 添加图例
-                plt.legend(loc='upper right', bbox_to_anchor=(0.1, 0.1))
-                
-                # 添加标题
-                plt.title("各位置维度得分对比雷达图", size=15, y=1.1)
-                
-                # 显示雷达图
-                st.pyplot(fig)
+                series = [(row["位置名称"], row[scoring.SCORE_COLUMNS].tolist()) for _, row in top_locations.iterrows()]
+                with profiler.stage("多店对比/雷达图"):
+                    st.image(cached_chart(("radar_top3",) + chart_key,
+                                          lambda: plotting.radar_chart(scoring.CATEGORIES, series,
+                                                                       "各位置维度得分对比雷达图", figsize=(10, 10))))
                 
                 # 生成对比建议
                 st.subheader("选址对比建议")
                 best_location = scores_df.iloc[0]["位置名称"]
-                worst_location = scores_df.iloc[-1]["位置名称"]
+                worst_location = df["位置名称"].iloc[worst_index[0]]
                 
                 st.write(f"**推荐位置**: {best_location} (综合评分: {scores_df.iloc[0]['综合评分']:.1f}/100)")
-                st.write(f"**不推荐位置**: {worst_location} (综合评分: {scores_df.iloc[-1]['综合评分']:.1f}/100)")
-                
+                st.write(f"**不推荐位置**: {worst_location} (综合评分: {overall_scores[worst_index[0]]:.1f}/100)")
+
+                # 批量开店: 在月租金预算内选择一组位置，距离较近的位置互相分流
+                with st.expander("批量开店组合推荐"):
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        portfolio_k = st.number_input("开店数量", 1, len(df), min(len(df), 10))
+                        portfolio_budget = st.number_input("月租金总预算 (元，0表示不限)", 0, None, 0, 10000)
+                    with col2:
+                        portfolio_radius = st.number_input("分流半径 (米)", 50, 10000,
+                                                           portfolio.DEFAULT_CANNIBALIZATION_RADIUS, 50)
+                        portfolio_penalty = st.slider("分流折减系数", 0.0, 1.0,
+                                                      portfolio.DEFAULT_CANNIBALIZATION_PENALTY, 0.05,
+                                                      help="两店重合时得分折减的比例，随距离线性减小到半径处为0")
+                    if not {"纬度", "经度"} <= set(df.columns):
+                        st.caption("数据不含纬度、经度列，组合推荐不考虑门店之间的分流")
+                    if st.checkbox("计算开店组合"):
+                        with profiler.stage("多店对比/组合推荐", len(df)):
+                            selected, gains = run_portfolio(digest, tuple(weights), portfolio_k, portfolio_budget,
+                                                            portfolio_radius, portfolio_penalty, df, overall_scores)
+                        portfolio_df = portfolio.portfolio_frame(df["位置名称"], overall_scores, selected, gains,
+                                                                 df["月租金"].to_numpy())
+                        st.dataframe(portfolio_df, hide_index=True)
+                        st.write(f"共选出 {len(selected)} 个位置，分流后总得分 {gains.sum():.1f}，"
+                                 f"月租金合计 {portfolio_df['月租金'].sum():,.0f} 元")
+
+                # 投资回报风险: 按侧边栏的模拟假设对全部位置模拟回本周期
+                with st.expander("投资回报风险分析"):
+                    if st.checkbox("运行投资回报模拟", help="对全部位置模拟回本周期，位置较多时需要数秒"):
+                        with profiler.stage("多店对比/投资回报模拟", len(df)):
+                            roi_result = run_roi_simulation(digest, roi_assumptions, n_simulations, df)
+                        roi_sort = st.selectbox("排序方式", ["回本周期P50 (月)", "亏损概率", "预估月利润"], key="roi_sort")
+                        roi_df = roi.roi_frame(df["位置名称"], roi_result)
+                        roi_df.insert(1, "综合评分", overall_scores)
+                        roi_df = roi_df.sort_values(roi_sort, ascending=roi_sort != "预估月利润", kind="stable")
+                        st.dataframe(roi_df.head(top_k), hide_index=True)
+                        st.caption(f"亏损概率超过50%的位置: {int((roi_result.loss_probability > 0.5).sum()):,} / {len(df):,}")
+
+                # 权重敏感性: 在当前权重附近抽样，统计推荐结果的稳定性
+                with st.expander("权重敏感性分析"):
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        n_weight_samples = st.number_input("权重抽样次数", 100, 10000, sensitivity.DEFAULT_SAMPLES, 100)
+                    with col2:
+                        concentration = st.number_input("集中度", 5, 1000, sensitivity.DEFAULT_CONCENTRATION, 5,
+                                                        help="越大表示抽样的权重越接近当前侧边栏权重")
+                    with col3:
+                        sensitivity_k = st.number_input("前K名", 1, len(df), min(len(df), 10))
+                    if st.checkbox("运行敏感性分析"):
+                        with profiler.stage("多店对比/权重敏感性", len(df)):
+                            first_probability, top_probability = run_sensitivity(
+                                digest, tuple(weights), n_weight_samples, concentration, sensitivity_k, score_matrix)
+                        st.dataframe(sensitivity.sensitivity_frame(df["位置名称"], overall_scores,
+                                                                   first_probability, top_probability, 50),
+                                     hide_index=True)
+                        st.caption(f"共 {int((top_probability > 0).sum()):,} 个位置至少在一组抽样权重下进入前{sensitivity_k}名")
+
                 # 分析各位置的优势和劣势
                 st.write("**位置优劣势分析**:")
-                for _, row in scores_df.iterrows():
-                    strengths = []
-                    weaknesses = []
-                    
-                    # 找出优势和劣势维度
-                    if row["人流量得分"] > 80:
-                        strengths.append("人流量充足")
-                    elif row["人流量得分"] < 60:
-                        weaknesses.append("人流量不足")
-                    
-                    if row["租金成本得分"] > 80:
-                        strengths.append("租金成本合理")
-                    elif row["租金成本得分"] < 60:
-                        weaknesses.append("租金成本较高")
-                    
-                    if row["竞争情况得分"] > 80:
-                        strengths.append("竞争压力小")
-                    elif row["竞争情况得分"] < 60:
-                        weaknesses.append("竞争压力大")
-                    
-                    if row["周边配套得分"] > 80:
-                        strengths.append("周边配套完善")
-                    elif row["周边配套得分"] < 60:
-                        weaknesses.append("周边配套不足")
-                    
-                    if row["交通便利性得分"] > 80:
-                        strengths.append("交通便利")
-                    elif row["交通便利性得分"] < 60:
-                        weaknesses.append("交通不便")
-                    
-                    # 显示分析结果
-                    st.write(f"**{row['位置名称']}**:")
-                    if strengths:
-                        st.write(f"  优势: {', '.join(strengths)}")
-                    if weaknesses:
-                        st.write(f"  劣势: {', '.join(weaknesses)}")
+                with profiler.stage("多店对比/优劣势报告", len(df)):
+                    report_df = build_strengths_report(digest, tuple(weights), df["位置名称"], score_matrix,
+                                                       overall_scores)
+                
+                # 筛选与排序在服务端完成，浏览器只接收当前页
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    name_filter = st.text_input("按位置名称筛选")
+                    sort_by = st.selectbox("排序方式", ["排名", "优势数量", "劣势数量"])
+                with col2:
+                    required_strengths = st.multiselect("需具备的优势", scoring.STRENGTH_LABELS)
+                    sort_ascending = st.checkbox("升序排列", value=True)
+                with col3:
+                    excluded_weaknesses = st.multiselect("排除的劣势", scoring.WEAKNESS_LABELS)
+                    page_size = st.selectbox("每页显示", [20, 50, 100, 200], index=1)
+                
+                mask = np.ones(len(report_df), dtype=bool)
+                if name_filter:
+                    mask &= report_df["位置名称"].astype(str).str.contains(name_filter, regex=False).to_numpy()
+                if required_strengths:
+                    bits = sum(1 << scoring.STRENGTH_LABELS.index(label) for label in required_strengths)
+                    mask &= (report_df["优势编码"].to_numpy() & bits) == bits
+                if excluded_weaknesses:
+                    bits = sum(1 << scoring.WEAKNESS_LABELS.index(label) for label in excluded_weaknesses)
+                    mask &= (report_df["劣势编码"].to_numpy() & bits) == 0
+                report_view = report_df[mask]
+                if sort_by != "排名" or not sort_ascending:
+                    report_view = report_view.sort_values([sort_by, "排名"], ascending=[sort_ascending, True],
+                                                          kind="stable")
+                
+                page_count = max(1, -(-len(report_view) // page_size))
+                page = st.number_input(f"页码 (共 {page_count} 页)", 1, page_count, 1)
+                page_start = (page - 1) * page_size
+                with profiler.stage("多店对比/报告表格", page_size):
+                    st.dataframe(
+                        report_view.iloc[page_start:page_start + page_size].drop(columns=["优势编码", "劣势编码"]),
+                        hide_index=True
+                    )
+                st.caption(f"筛选出 {len(report_view):,} / {len(report_df):,} 个位置")
         
         except Exception as e:
             st.error(f"数据处理出错: {str(e)}")
@@ -573,12 +809,18 @@ with tab3:
         )
     
     # 文件上传
-    uploaded_file = st.file_uploader("上传位置数据进行聚类分析", type="csv")
+    uploaded_file = st.file_uploader("上传位置数据进行聚类分析 (CSV/Excel/Parquet/Arrow)",
+                                     type=schema.SUPPORTED_TYPES)
     
     if uploaded_file is not None:
         # 读取数据
         try:
-            df = pd.read_csv(uploaded_file)
+            digest = file_digest(uploaded_file)
+            sheet = select_sheet(uploaded_file, digest, "clustering_sheet")
+            with profiler.stage("数据分析/读取"):
+                df = load_uploaded_table(digest, uploaded_file, "CLUSTERING_SCHEMA", sheet)
+            if sheet is not None:
+                digest = f"{digest}:{sheet}"
             st.success("数据上传成功！")
             
             # 显示数据预览
@@ -595,51 +837,88 @@ with tab3:
             )
             
             if selected_features:
-                # 设置聚类数量
-                n_clusters = st.slider("选择聚类数量", 2, 10, 3)
+                # 所选特征缺失或超出范围的行隔离，不参与聚类
+                with profiler.stage("数据分析/校验", len(df)):
+                    validated = validate_upload(digest, df, "CLUSTERING_RULES", tuple(selected_features),
+                                                "CLUSTERING_SCHEMA")
+                show_quarantine(validated, "聚类分析数据_未通过校验", digest)
+                df = validated.clean
+                
+                # 选择聚类引擎
+                engine_name = st.selectbox(
+                    "聚类引擎",
+                    list(clustering.ENGINES),
+                    help="精确KMeans结果最稳定；MiniBatchKMeans逐块拟合，适合大文件"
+                )
+                
+                # 设置聚类数量 (手动或自动扫描)
+                auto_k = st.checkbox("自动选择聚类数量", help="并行拟合多个K值，按肘部法则和抽样轮廓系数推荐")
+                if auto_k:
+                    k_range = st.slider("K值扫描范围", 2, 10, (2, 10))
+                    with profiler.stage("数据分析/K值扫描", len(df)):
+                        sweep = run_k_sweep(digest, tuple(selected_features), k_range,
+                                            clustering.ENGINES[engine_name], df)
+                    
+                    st.image(cached_chart(
+                        ("k_sweep", digest, tuple(selected_features), k_range, engine_name),
+                        lambda: plotting.line_charts(sweep.k_values, [
+                            (sweep.inertias, "惯性 (Inertia)", "肘部法则"),
+                            (sweep.silhouettes, "轮廓系数", "轮廓系数 (抽样计算)")
+                        ], sweep.recommended)))
+                    
+                    n_clusters = sweep.recommended
+                    st.info(f"推荐聚类数量: {n_clusters} (扫描耗时 {sweep.seconds:.2f} 秒)")
+                else:
+                    n_clusters = st.slider("选择聚类数量", 2, 10, 3)
                 
                 # 执行聚类分析
                 if st.button("执行聚类分析"):
-                    # 数据标准化
-                    scaler = MinMaxScaler()
-                    scaled_data = scaler.fit_transform(df[selected_features])
+                    # 按文件、特征、聚类数量和引擎缓存聚类结果
+                    with profiler.stage("数据分析/聚类", len(df)):
+                        result = run_clustering(digest, tuple(selected_features), n_clusters,
+                                                clustering.ENGINES[engine_name], df)
+                    df = df.assign(聚类=result.labels)
                     
-                    # K-means聚类
-                    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-                    df["聚类"] = kmeans.fit_predict(scaled_data)
+                    col1, col2 = st.columns(2)
+                    col1.metric("拟合耗时", f"{result.fit_seconds:.2f} 秒")
+                    col2.metric("惯性 (Inertia)", f"{result.inertia:,.2f}")
                     
                     # 显示聚类结果
                     st.subheader("聚类分析结果")
-                    st.dataframe(df)
+                    with profiler.stage("数据分析/结果表格", len(df)):
+                        st.dataframe(df)
                     
                     # 可视化聚类结果
                     st.subheader("聚类可视化")
                     
+                    # 点数较多时按所选方式抽样或绘制密度图
+                    render_mode = plotting.RENDER_MODES[st.radio(
+                        "大数据量散点图渲染方式", list(plotting.RENDER_MODES), horizontal=True,
+                        help=f"位置数量超过 {plotting.SCATTER_POINT_THRESHOLD:,} 个时生效"
+                    )]
+                    chart_key = (digest, tuple(selected_features), n_clusters, engine_name)
+                    
                     # 如果有至少两个特征，可以绘制散点图
                     if len(selected_features) >= 2:
                         st.write("**聚类散点图**")
-                        fig, ax = plt.subplots(figsize=(10, 6))
-                        scatter = ax.scatter(df[selected_features[0]], df[selected_features[1]], 
-                                            c=df["聚类"], cmap='viridis')
-                        ax.set_xlabel(selected_features[0])
-                        ax.set_ylabel(selected_features[1])
-                        ax.set_title(f"基于{selected_features[0]}和{selected_features[1]}的聚类结果")
-                        plt.colorbar(scatter, label="聚类")
-                        st.pyplot(fig)
+                        with profiler.stage("数据分析/散点图", len(df)):
+                            st.image(cached_chart(("scatter", render_mode) + chart_key,
+                                                  lambda: plotting.cluster_scatter(
+                                                      df[selected_features[0]], df[selected_features[1]], df["聚类"],
+                                                      selected_features[0], selected_features[1],
+                                                      f"基于{selected_features[0]}和{selected_features[1]}的聚类结果",
+                                                      render_mode)))
                     
                     # 如果有至少三个特征，可以绘制3D散点图
                     if len(selected_features) >= 3:
                         st.write("**3D聚类散点图**")
-                        fig = plt.figure(figsize=(12, 8))
-                        ax = fig.add_subplot(111, projection='3d')
-                        scatter = ax.scatter(df[selected_features[0]], df[selected_features[1]], 
-                                            df[selected_features[2]], c=df["聚类"], cmap='viridis')
-                        ax.set_xlabel(selected_features[0])
-                        ax.set_ylabel(selected_features[1])
-                        ax.set_zlabel(selected_features[2])
-                        ax.set_title(f"基于{selected_features[0]}、{selected_features[1]}和{selected_features[2]}的3D聚类结果")
-                        plt.colorbar(scatter, label="聚类")
-                        st.pyplot(fig)
+                        with profiler.stage("数据分析/3D散点图", len(df)):
+                            st.image(cached_chart(("scatter_3d",) + chart_key,
+                                                  lambda: plotting.cluster_scatter_3d(
+                                                      df[selected_features[0]], df[selected_features[1]],
+                                                      df[selected_features[2]], df["聚类"],
+                                                      selected_features[0], selected_features[1], selected_features[2],
+                                                      f"基于{selected_features[0]}、{selected_features[1]}和{selected_features[2]}的3D聚类结果")))
                     
                     # 分析每个聚类的特点
                     st.subheader("聚类特征分析")
@@ -700,16 +979,192 @@ with tab3:
                             st.write("  - 根据所选特征无法生成具体建议，请尝试选择更多关键特征")
                     
                     # 导出聚类结果
-                    csv = df.to_csv(index=False, encoding='utf-8-sig')
+                    with profiler.stage("数据分析/导出", len(df)):
+                        # 聚类结果只在点击"执行聚类分析"后的这一次运行中显示，直接生成导出文件
+                        download_table("下载聚类分析结果", "选址聚类分析结果", ("clusters",) + chart_key, df,
+                                       on_demand=False)
+                    
+                    # 导出聚类模型，供之后对新位置直接分类
+                    cluster_model = clustering.ClusterModel.from_result(result)
+                    st.session_state["cluster_model"] = cluster_model
+                    with profiler.stage("数据分析/相似位置索引", len(df)):
+                        st.session_state["site_index"] = similarity.SiteIndex(cluster_model, df, result.labels)
                     st.download_button(
-                        label="下载聚类分析结果",
-                        data=csv,
-                        file_name="选址聚类分析结果.csv",
-                        mime="text/csv"
+                        label="下载聚类模型",
+                        data=cluster_model.to_bytes(),
+                        file_name="选址聚类模型.npz",
+                        mime="application/octet-stream"
                     )
         
         except Exception as e:
             st.error(f"数据处理出错: {str(e)}")
+    
+    # 使用已保存的聚类模型对新位置分类
+    with st.expander("使用已保存的聚类模型分类新位置"):
+        model_file = st.file_uploader("上传聚类模型文件", type="npz")
+        new_sites_file = st.file_uploader("上传待分类的新位置数据", type=schema.SUPPORTED_TYPES)
+        update_centroids = st.checkbox("根据新位置增量更新聚类中心")
+        
+        if model_file is not None and new_sites_file is not None:
+            try:
+                cluster_model = clustering.ClusterModel.load(model_file.getvalue())
+                new_sites = schema.read_table(new_sites_file.getvalue(), new_sites_file.name,
+                                              schema.CLUSTERING_SCHEMA)
+                missing_columns = [col for col in cluster_model.features if col not in new_sites.columns]
+                if missing_columns:
+                    st.error(f"数据缺少模型所需的列: {', '.join(missing_columns)}")
+                else:
+                    if update_centroids:
+                        labels = cluster_model.update(new_sites)
+                    else:
+                        labels = cluster_model.predict(new_sites)
+                    new_sites = new_sites.assign(聚类=labels)
+                    
+                    st.success(f"已将 {len(new_sites)} 个新位置分配到 {cluster_model.n_clusters} 个聚类")
+                    st.dataframe(new_sites)
+                    download_table("下载新位置分类结果", "新位置聚类结果",
+                                   ("new_sites", file_digest(model_file), file_digest(new_sites_file),
+                                    update_centroids), new_sites)
+                    if update_centroids:
+                        st.download_button(
+                            label="下载更新后的聚类模型",
+                            data=cluster_model.to_bytes(),
+                            file_name="选址聚类模型.npz",
+                            mime="application/octet-stream"
+                        )
+            except Exception as e:
+                st.error(f"数据处理出错: {str(e)}")
+
+# 城市网格扫描标签页
+with tab4:
+    st.header("城市网格扫描")
+    st.write("将城市范围划分为网格，根据空间图层为每个网格评分，寻找评分最高的区域")
+    
+    # 上传空间图层 (均需包含纬度、经度列)
+    layers, layer_digests = {}, []
+    layer_columns = st.columns(2)
+    for i, (layer_key, (layer_label, value_column)) in enumerate(grid.LAYERS.items()):
+        with layer_columns[i % 2]:
+            layer_help = "需包含纬度、经度列" + (f"以及{value_column}列" if value_column else "")
+            layer_file = st.file_uploader(f"上传{layer_label}点位数据", type=schema.SUPPORTED_TYPES,
+                                          help=layer_help, key=f"grid_layer_{layer_key}")
+        if layer_file is not None:
+            try:
+                layer_digest = file_digest(layer_file)
+                layers[layer_key], layer_dropped = load_point_index(layer_digest, layer_file, value_column)
+                layer_digests.append((layer_key, layer_digest))
+                if layer_dropped:
+                    st.warning(f"{layer_label}数据中 {layer_dropped:,} 个点位未通过校验 "
+                               "(经纬度或数值缺失、超出范围)，已剔除")
+            except Exception as e:
+                st.error(f"{layer_label}数据处理出错: {str(e)}")
+    
+    if not layers:
+        st.info("请至少上传一个空间图层，未提供的图层按单店评估表单的默认值计算")
+    else:
+        try:
+            # 默认扫描范围为所有图层点位的外包范围
+            bounds = np.array([layer.bounds for layer in layers.values()])
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                lat_min = st.number_input("纬度下限", -90.0, 90.0, float(bounds[:, 0].min()), format="%.4f")
+                lat_max = st.number_input("纬度上限", -90.0, 90.0, float(bounds[:, 1].max()), format="%.4f")
+            with col2:
+                lon_min = st.number_input("经度下限", -180.0, 180.0, float(bounds[:, 2].min()), format="%.4f")
+                lon_max = st.number_input("经度上限", -180.0, 180.0, float(bounds[:, 3].max()), format="%.4f")
+            with col3:
+                cell_size = st.number_input("网格边长 (米)", 20, 5000, grid.DEFAULT_CELL_SIZE, 10)
+                grid_city_level = st.selectbox("城市等级", list(scoring.CITY_RENT_STANDARDS), key="grid_city_level")
+            grid_radius = st.number_input("配套与竞争统计半径 (米)", 50, 5000, spatial.DEFAULT_COMPETITOR_RADIUS, 50,
+                                          key="grid_radius")
+            
+            city_grid = grid.Grid(lat_min, lat_max, lon_min, lon_max, cell_size)
+            n_rows, n_cols = city_grid.shape
+            st.caption(f"共 {n_rows:,} × {n_cols:,} = {city_grid.size:,} 个网格")
+            
+            # 网格得分矩阵与权重无关，调整权重时只需重新加权
+            grid_matrix = score_city_grid(tuple(layer_digests), city_grid, grid_city_level, grid_radius, layers)
+            grid_scores = scoring.weighted_scores(grid_matrix, weights)
+            
+            grid_top_k = st.slider("显示评分最高的网格数量", 1, min(city_grid.size, 200), min(city_grid.size, 20))
+            cells_df = grid.top_cells(city_grid, grid_matrix, grid_scores, grid_top_k)
+            
+            grid_key = (tuple(layer_digests), city_grid, grid_city_level, grid_radius, tuple(weights), grid_top_k)
+            st.image(cached_chart(("grid_heatmap",) + grid_key,
+                                  lambda: plotting.score_heatmap(
+                                      grid_scores.reshape(n_rows, n_cols), (lon_min, lon_max, lat_min, lat_max),
+                                      (cells_df["纬度"], cells_df["经度"]))))
+            
+            st.subheader("评分最高的网格")
+            st.dataframe(cells_df, hide_index=True)
+        
+        except Exception as e:
+            st.error(f"数据处理出错: {str(e)}")
+
+# 历史记录标签页
+with tab5:
+    st.header("历史评估记录")
+    st.write("查询已保存的多店对比评估结果，筛选条件走数据库索引，无需重新评分")
+    
+    # 第一次保存评估结果时才创建数据库，只查看时不创建
+    if not store.database_exists():
+        st.info('暂无历史记录，可在"多店对比"中保存评估结果')
+    else:
+        with contextlib.closing(store.connect()) as conn:
+            analyses_df = store.list_analyses(conn)
+            if analyses_df.empty:
+                st.info('暂无历史记录，可在"多店对比"中保存评估结果')
+            else:
+                st.subheader("已保存的分析")
+                st.dataframe(analyses_df, hide_index=True)
+            
+                st.subheader("筛选历史评估")
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    analysis_options = ["全部"] + analyses_df["分析编号"].tolist()
+                    analysis_choice = st.selectbox("分析编号", analysis_options)
+                    history_name = st.text_input("位置名称包含", key="history_name")
+                with col2:
+                    history_cities = st.multiselect("城市等级", list(scoring.CITY_RENT_STANDARDS))
+                    history_districts = st.multiselect("商圈类型", scoring.DISTRICT_TYPES)
+                with col3:
+                    history_scores = st.slider("综合评分范围", 0.0, 100.0, (0.0, 100.0), 1.0)
+                    history_dates = st.date_input("评估日期范围", (date.today() - timedelta(days=90), date.today()))
+            
+                filters = {
+                    "analysis_id": None if analysis_choice == "全部" else analysis_choice,
+                    "city_levels": history_cities,
+                    "districts": history_districts,
+                    # 默认范围不加评分条件，综合评分可能为负
+                    "min_score": history_scores[0] if history_scores[0] > 0 else None,
+                    "max_score": history_scores[1] if history_scores[1] < 100 else None,
+                    "name": history_name,
+                }
+                if len(history_dates) == 2:
+                    filters["since"] = history_dates[0].isoformat()
+                    filters["until"] = (history_dates[1] + timedelta(days=1)).isoformat()
+            
+                total = store.count_evaluations(conn, **filters)
+                history_page_size = st.selectbox("每页显示", [50, 100, 500, 1000], index=1, key="history_page_size")
+                history_pages = max(1, -(-total // history_page_size))
+                history_page = st.number_input(f"页码 (共 {history_pages} 页)", 1, history_pages, 1, key="history_page")
+                history_df = store.query_evaluations(conn, history_page_size, (history_page - 1) * history_page_size,
+                                                     **filters)
+                st.dataframe(history_df, hide_index=True)
+                st.caption(f"共 {total:,} 条评估记录满足条件，按综合评分降序排列")
+
+# 本次运行各阶段的统计及共享缓存的使用情况显示在侧边栏
+with diagnostics_panel:
+    if profiler.enabled:
+        stages_df = profiler.frame()
+        st.dataframe(stages_df, hide_index=True)
+        st.caption(f"共 {len(stages_df)} 个阶段 (嵌套阶段与上层阶段的耗时有重叠)")
+    # 本次运行结束，注销内存跟踪 (其他会话仍在跟踪时不会关闭 tracemalloc)
+    profiler.close()
+    cache_stats = cache.default_cache().stats()
+    st.caption(f"共享缓存: {cache_stats.entries} 项，{cache_stats.used_bytes / 1024 ** 2:,.1f} / "
+               f"{cache_stats.budget_bytes / 1024 ** 2:,.0f} MB，命中 {cache_stats.hits:,} 次，"
+               f"未命中 {cache_stats.misses:,} 次 (命中率 {cache_stats.hit_rate:.0%})，淘汰 {cache_stats.evictions:,} 次")
 
 # 页面底部信息
 st.markdown("---")
@@ -0,0 +1,126 @@
+"""多进程分片评分
+
+把候选位置表的数值输入写入共享内存，按行切分给进程池中的各个工作进程。
+工作进程把维度得分、综合评分和优劣势编码直接写回共享内存中的结果缓冲区，
+只把各自分片的前K名下标回传给父进程，由父进程做K路归并得到最终排名。
+"""
+import heapq
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import scoring
+
+# 输入矩阵的列：数值输入列 + 城市等级换算后的标准租金
+_INPUT_COLUMNS = scoring.INPUT_COLUMNS + ["标准租金"]
+_INPUT_INDEX = {name: j for j, name in enumerate(_INPUT_COLUMNS)}
+# 结果矩阵的列：六个维度得分 + 综合评分
+_N_RESULTS = len(scoring.SCORE_COLUMNS) + 1
+
+
+def _score_rows(start, stop, weights, k, inputs, results, codes):
+    shard = inputs[start:stop]
+    matrix = np.empty((stop - start, len(scoring.SCORE_COLUMNS)), dtype=np.float64)
+    scoring.dimension_scores(lambda name: shard[:, _INPUT_INDEX[name]], shard[:, -1], matrix)
+    overall = scoring.weighted_scores(matrix, weights)
+    results[start:stop, :-1] = matrix
+    results[start:stop, -1] = overall
+    codes[start:stop, 0], codes[start:stop, 1] = scoring.classify_strengths(matrix)
+
+    top = scoring.rank_top_k(overall, k)
+    return [(-overall[i], start + i) for i in top]
+
+
+def _views(names, n_rows):
+    # 连接父进程创建的共享内存块
+    blocks = {key: shared_memory.SharedMemory(name=name) for key, name in names.items()}
+    return blocks, _arrays(blocks, n_rows)
+
+
+def _arrays(blocks, n_rows):
+    return (np.ndarray((n_rows, len(_INPUT_COLUMNS)), dtype=np.float64, buffer=blocks["inputs"].buf),
+            np.ndarray((n_rows, _N_RESULTS), dtype=np.float64, buffer=blocks["results"].buf),
+            np.ndarray((n_rows, 2), dtype=np.uint8, buffer=blocks["codes"].buf))
+
+
+def _score_shard(spec):
+    # 工作进程：计算 [start, stop) 行并写回共享内存，返回分片内的前K名
+    start, stop, n_rows, weights, k, names = spec
+    blocks, arrays = _views(names, n_rows)
+    try:
+        return _score_rows(start, stop, weights, k, *arrays)
+    finally:
+        del arrays
+        for block in blocks.values():
+            block.close()
+
+
+def _fill_inputs(inputs, df):
+    for j, name in enumerate(scoring.INPUT_COLUMNS):
+        inputs[:, j] = scoring._column(df, name)
+    inputs[:, -1] = scoring.city_rent_standard(df["城市等级"])
+
+
+def _collect(arrays):
+    # 把结果从共享内存复制出来，之后即可释放共享内存
+    _, results, codes = arrays
+    return results[:, :-1].copy(), results[:, -1].copy(), codes[:, 0].copy(), codes[:, 1].copy()
+
+
+class ShardedScorer:
+    """进程池分片评分器，可在多次评分之间复用同一个进程池"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        # 使用 spawn 避免在多线程的服务进程中 fork
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown()
+
+    def score(self, df, weights, k=None):
+        """返回 (N×6 维度得分, 综合评分, 优势编码, 劣势编码, 前K名下标)"""
+        n_rows = len(df)
+        k = n_rows if k is None else min(k, n_rows)
+        weights = scoring.normalize_weights(weights)
+        blocks = {}
+        try:
+            for key, shape, dtype in (("inputs", (n_rows, len(_INPUT_COLUMNS)), np.float64),
+                                      ("results", (n_rows, _N_RESULTS), np.float64),
+                                      ("codes", (n_rows, 2), np.uint8)):
+                size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                blocks[key] = shared_memory.SharedMemory(create=True, size=size)
+
+            _fill_inputs(_arrays(blocks, n_rows)[0], df)
+
+            # 按行切分，每个进程至少处理一个分片
+            bounds = np.linspace(0, n_rows, min(self.workers, max(1, n_rows)) + 1).astype(np.int64)
+            names = {key: block.name for key, block in blocks.items()}
+            specs = [(int(start), int(stop), n_rows, weights, k, names)
+                     for start, stop in zip(bounds[:-1], bounds[1:])]
+            shard_tops = list(self.pool.map(_score_shard, specs))
+
+            # 各分片前K名已按评分降序排列，K路归并即可得到全局排名
+            merged = itertools.islice(heapq.merge(*shard_tops), k)
+            top_index = np.fromiter((i for _, i in merged), dtype=np.int64, count=k)
+            return _collect(_arrays(blocks, n_rows)) + (top_index,)
+        finally:
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+
+
+def score_parallel(df, weights, k=None, workers=None):
+    """一次性多进程评分，便于脚本直接调用"""
+    with ShardedScorer(workers) as scorer:
+        return scorer.score(df, weights, k)
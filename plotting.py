@@ -0,0 +1,185 @@
+"""图表渲染
+
+所有图表都直接创建 matplotlib Figure (不经过 pyplot 的全局图形管理器)，渲染为PNG后立即释放，
+长时间运行的服务进程不会因为反复重绘而累积图形对象。点数超过阈值时自动改用分层抽样或密度图。
+matplotlib (包括 3D 坐标轴) 在第一次绘图时才导入，中文字体每个进程只配置一次。
+"""
+import functools
+import io
+
+import numpy as np
+
+# 中文字体候选，按顺序使用已安装的第一个 (Windows、macOS、Linux 常见字体)
+CJK_FONTS = ['SimHei', 'Microsoft YaHei', 'PingFang SC', 'Heiti SC', 'Noto Sans CJK SC',
+             'Source Han Sans SC', 'WenQuanYi Micro Hei', 'WenQuanYi Zen Hei', 'Arial Unicode MS']
+
+# 超过该点数时散点图改用抽样或密度图
+SCATTER_POINT_THRESHOLD = 20_000
+# 柱状图最多显示的位置数量及显示数值标签的上限
+BAR_CHART_MAX = 100
+BAR_LABEL_MAX = 30
+RENDER_MODES = {"分层抽样": "sample", "密度图": "hexbin"}
+
+
+@functools.lru_cache(maxsize=None)
+def _figure_class():
+    # 首次绘图时导入 matplotlib 并设置中文字体，之后直接复用
+    from matplotlib import font_manager, rcParams, rcParamsDefault
+    from matplotlib.figure import Figure
+
+    installed = {font.name for font in font_manager.fontManager.ttflist}
+    # 只列出已安装的字体，避免每次查找缺失字体时告警
+    rcParams['font.sans-serif'] = ([name for name in CJK_FONTS if name in installed]
+                                   + rcParamsDefault['font.sans-serif'])
+    rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
+    return Figure
+
+
+def new_figure(**kwargs):
+    """创建不经过 pyplot 的图表"""
+    return _figure_class()(**kwargs)
+
+
+def to_png(fig, dpi=120):
+    """把图表渲染为PNG字节并释放图表"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    fig.clear()
+    return buffer.getvalue()
+
+
+def stratified_sample(labels, max_points, seed=42):
+    """按聚类分层抽样，各聚类按原有比例保留，且每个聚类至少保留一个点"""
+    labels = np.asarray(labels)
+    if len(labels) <= max_points:
+        return np.arange(len(labels))
+    rng = np.random.default_rng(seed)
+    clusters, counts = np.unique(labels, return_counts=True)
+    quotas = np.maximum(1, np.round(counts / len(labels) * max_points).astype(np.int64))
+    order = np.argsort(labels, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    picked = [rng.choice(order[start:start + count], size=min(quota, count), replace=False)
+              for start, count, quota in zip(starts, counts, quotas)]
+    return np.sort(np.concatenate(picked))
+
+
+def radar_chart(categories, series, title, figsize=(8, 8)):
+    """series 为 [(名称, 各维度得分), ...]"""
+    angles = [n / float(len(categories)) * 2 * np.pi for n in range(len(categories))]
+    angles += angles[:1]  # 闭合雷达图
+
+    fig = new_figure(figsize=figsize)
+    ax = fig.add_subplot(111, polar=True)
+    colors = ['blue', 'red', 'green']
+    for i, (label, values) in enumerate(series):
+        values = list(values) + list(values[:1])  # 闭合雷达图
+        color = colors[i % len(colors)] if len(series) > 1 else None
+        ax.plot(angles, values, linewidth=2, linestyle='solid', color=color, label=label)
+        ax.fill(angles, values, alpha=0.1 if len(series) > 1 else 0.25, color=color)
+
+    ax.set_xticks(angles[:-1])
+    ax.set_xticklabels(categories)
+    ax.set_ylim(0, 100)
+    if len(series) > 1:
+        ax.legend(loc='upper right', bbox_to_anchor=(0.1, 0.1))
+    ax.set_title(title, size=15, y=1.1)
+    return to_png(fig)
+
+
+def score_bar_chart(names, scores, top_n=BAR_CHART_MAX):
+    """综合评分柱状图，只画前 top_n 个位置 (names/scores 需已按评分降序排列)"""
+    names, scores = list(names[:top_n]), np.asarray(scores[:top_n])
+    fig = new_figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+    bars = ax.bar(range(len(names)), scores)
+    ax.set_xticks(range(len(names)))
+    ax.set_xticklabels(names, rotation=90 if len(names) > 10 else 0)
+    ax.set_ylim(0, 100)
+    ax.set_xlabel("位置")
+    ax.set_ylabel("综合评分")
+    ax.set_title("各位置综合评分对比")
+
+    # 位置较少时添加数值标签
+    if len(names) <= BAR_LABEL_MAX:
+        for bar in bars:
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height + 1,
+                    f'{height:.1f}', ha='center', va='bottom')
+    fig.tight_layout()
+    return to_png(fig)
+
+
+def line_charts(k_values, panels, recommended=None):
+    """并排的折线图，panels 为 [(数值, y轴标签, 标题), ...]"""
+    fig = new_figure(figsize=(12, 4))
+    axes = fig.subplots(1, len(panels))
+    for ax, (values, ylabel, title) in zip(np.atleast_1d(axes), panels):
+        ax.plot(k_values, values, marker='o')
+        if recommended is not None:
+            ax.axvline(recommended, linestyle='--', color='gray')
+        ax.set_xlabel("聚类数量")
+        ax.set_ylabel(ylabel)
+        ax.set_title(title)
+    fig.tight_layout()
+    return to_png(fig)
+
+
+def cluster_scatter(x, y, labels, xlabel, ylabel, title, mode="sample",
+                    max_points=SCATTER_POINT_THRESHOLD):
+    """二维聚类散点图，点数超过阈值时按 mode 使用分层抽样或六边形密度图"""
+    x, y, labels = np.asarray(x), np.asarray(y), np.asarray(labels)
+    fig = new_figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+    if len(x) > max_points and mode == "hexbin":
+        hexbin = ax.hexbin(x, y, gridsize=80, bins="log", cmap='viridis', mincnt=1)
+        fig.colorbar(hexbin, ax=ax, label="位置数量 (对数)")
+        # 密度图上标出各聚类的中心位置
+        for cluster in np.unique(labels):
+            member = labels == cluster
+            ax.annotate(f"聚类{cluster}", (x[member].mean(), y[member].mean()),
+                        color='red', weight='bold', ha='center')
+    else:
+        index = stratified_sample(labels, max_points)
+        scatter = ax.scatter(x[index], y[index], c=labels[index], cmap='viridis', s=12 if len(index) > 1000 else None)
+        fig.colorbar(scatter, ax=ax, label="聚类")
+        if len(index) < len(x):
+            title = f"{title} (分层抽样 {len(index):,}/{len(x):,} 个点)"
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    return to_png(fig)
+
+
+def cluster_scatter_3d(x, y, z, labels, xlabel, ylabel, zlabel, title,
+                       max_points=SCATTER_POINT_THRESHOLD):
+    """三维聚类散点图，点数超过阈值时分层抽样"""
+    x, y, z, labels = np.asarray(x), np.asarray(y), np.asarray(z), np.asarray(labels)
+    index = stratified_sample(labels, max_points)
+    fig = new_figure(figsize=(12, 8))
+    ax = fig.add_subplot(111, projection='3d')
+    scatter = ax.scatter(x[index], y[index], z[index], c=labels[index], cmap='viridis')
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_zlabel(zlabel)
+    if len(index) < len(x):
+        title = f"{title} (分层抽样 {len(index):,}/{len(x):,} 个点)"
+    ax.set_title(title)
+    fig.colorbar(scatter, ax=ax, label="聚类")
+    return to_png(fig)
+
+
+def score_heatmap(surface, extent, top_points=None, title="网格综合评分热力图"):
+    """网格评分热力图，extent 为 (经度最小, 经度最大, 纬度最小, 纬度最大)，top_points 为 (纬度, 经度)"""
+    fig = new_figure(figsize=(10, 8))
+    ax = fig.add_subplot(111)
+    image = ax.imshow(surface, origin='lower', extent=extent, cmap='RdYlGn', vmin=0, vmax=100,
+                      aspect='auto', interpolation='nearest')
+    fig.colorbar(image, ax=ax, label="综合评分")
+    if top_points is not None:
+        lat, lon = top_points
+        ax.scatter(lon, lat, marker='*', s=120, color='blue', edgecolors='white', label="评分最高的网格")
+        ax.legend(loc='upper right')
+    ax.set_xlabel("经度")
+    ax.set_ylabel("纬度")
+    ax.set_title(title)
+    return to_png(fig)
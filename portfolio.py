@@ -0,0 +1,70 @@
+"""批量开店组合选择
+
+在月租金预算内从候选位置中选出 K 个位置，使组合的总得分最高。距离较近的两个门店会互相分流客源：
+每选中一个位置，其半径范围内的候选位置得分按距离乘以折减系数 (距离为0时折减 penalty，
+到半径边界时不折减)。折减只会让候选位置的边际收益下降，因此可以用惰性贪心：
+优先队列中保存上次计算的收益，只重新计算堆顶，堆顶的最新收益仍不低于次大值时直接选中。
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+
+import spatial
+
+DEFAULT_CANNIBALIZATION_RADIUS = 1000  # 米
+DEFAULT_CANNIBALIZATION_PENALTY = 0.5
+
+
+def select_portfolio(overall, k, rent=None, budget=None, lat=None, lon=None,
+                     radius_m=DEFAULT_CANNIBALIZATION_RADIUS, penalty=DEFAULT_CANNIBALIZATION_PENALTY):
+    """返回入选位置的下标 (按入选顺序) 及各自入选时的边际收益
+
+    rent/budget 为空时不限制预算，lat/lon 为空时不考虑分流；缺少经纬度的位置不参与分流计算。
+    """
+    base = np.maximum(np.asarray(overall, dtype=np.float64), 0)
+    factor = np.ones(len(base))
+    rent = None if rent is None else np.asarray(rent, dtype=np.float64)
+    remaining = np.inf if budget is None or rent is None else float(budget)
+    index = None
+    if lat is not None and lon is not None and penalty > 0:
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        located = np.isfinite(lat) & np.isfinite(lon)
+        # 索引只包含有经纬度的位置，located_rows 把索引内的下标映射回原始下标
+        located_rows = np.flatnonzero(located)
+        index = spatial.PointIndex(lat[located], lon[located])
+
+    heap = [(-gain, i) for i, gain in enumerate(base)]
+    heapq.heapify(heap)
+    selected, gains = [], []
+    while heap and len(selected) < k:
+        _, i = heapq.heappop(heap)
+        # 预算只会减少，超出剩余预算的位置之后也不可能入选
+        if rent is not None and rent[i] > remaining:
+            continue
+        gain = base[i] * factor[i]
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, i))
+            continue
+        selected.append(i)
+        gains.append(gain)
+        if rent is not None:
+            remaining -= rent[i]
+        if index is not None and located[i]:
+            neighbors, distances = index.neighbors_within(lat[i:i + 1], lon[i:i + 1], radius_m)
+            factor[located_rows[neighbors[0]]] *= 1 - penalty * (1 - distances[0] / radius_m)
+    return np.array(selected, dtype=np.int64), np.array(gains)
+
+
+def portfolio_frame(names, overall, selected, gains, rent=None):
+    """入选位置表"""
+    portfolio_df = pd.DataFrame({
+        "入选顺序": np.arange(1, len(selected) + 1),
+        "位置名称": np.asarray(names)[selected],
+        "综合评分": np.asarray(overall)[selected],
+        "分流后得分": gains,
+    })
+    if rent is not None:
+        portfolio_df["月租金"] = np.asarray(rent)[selected]
+        portfolio_df["累计月租金"] = portfolio_df["月租金"].cumsum()
+    return portfolio_df
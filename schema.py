@@ -0,0 +1,206 @@
+"""上传数据的列类型定义与读取
+
+多店对比和聚类分析的输入都按声明的列类型读取：取值范围较小的整数列压缩为
+uint8/uint16/uint32，城市等级、商圈类型等枚举列存为 category。
+除CSV外还支持 Parquet、Arrow (Feather) 和 Excel (xlsx) 格式。Excel 工作簿以 openpyxl 只读模式
+逐行读取，每 chunksize 行转换为一块按列类型压缩的 DataFrame，内存占用与工作簿大小无关。
+"""
+import io
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SUPPORTED_TYPES = ["csv", "xlsx", "parquet", "arrow", "feather"]
+DEFAULT_CHUNKSIZE = 100_000
+
+# 多店对比数据的列类型
+COMPARISON_SCHEMA = {
+    "城市等级": "category",
+    "商圈类型": "category",
+    "店铺面积": "uint16",
+    "月租金": "uint32",
+    "早高峰人流量": "uint16",
+    "午高峰人流量": "uint16",
+    "晚高峰人流量": "uint16",
+    "周末人流量": "uint16",
+    "节假日人流量": "uint16",
+    "竞争对手数量": "uint8",
+    "最近竞争对手距离": "uint16",
+    "市场饱和度": "uint8",
+    "竞争优势评估": "uint8",
+    "交通便利性": "uint8",
+    "周边配套完善度": "uint8",
+    "停车位数量": "uint16",
+    "公交地铁站数量": "uint8",
+    "周边住宅密度": "uint8",
+    "周边商业密度": "uint8",
+    "目标人群匹配度": "uint8",
+    "年龄结构匹配度": "uint8",
+    "收入水平匹配度": "uint8",
+    "消费习惯匹配度": "uint8",
+    "纬度": "float64",
+    "经度": "float64",
+}
+
+# 竞争对手/POI点位数据的列类型
+POI_SCHEMA = {
+    "纬度": "float64",
+    "经度": "float64",
+    "类别": "category",
+    "人流量": "float64",
+    "每平米租金": "float64",
+}
+
+# 聚类分析数据的列类型 (其余整数列按取值自动压缩)
+CLUSTERING_SCHEMA = {
+    "人流量": "uint32",
+    "每平米租金": "float32",
+    "竞争对手数量": "uint8",
+    "交通便利性": "uint8",
+}
+
+
+def table_format(filename):
+    """根据文件扩展名判断格式"""
+    suffix = os.path.splitext(filename)[1].lower().lstrip(".")
+    if suffix == "feather":
+        return "arrow"
+    return suffix if suffix in SUPPORTED_TYPES else "csv"
+
+
+def _downcast_integer(values, dtype):
+    # 只有全部为整数且在目标类型范围内时才压缩，否则退回 float32
+    info = np.iinfo(dtype)
+    if pd.api.types.is_integer_dtype(values):
+        integral = True
+    else:
+        integral = values.notna().all() and (values % 1 == 0).all()
+    if integral and values.min() >= info.min and values.max() <= info.max:
+        return values.astype(dtype)
+    return values.astype(np.float32)
+
+
+def apply_schema(df, schema):
+    """按声明的类型转换各列，未声明的整数列自动压缩 (浮点列保持原精度，如经纬度)"""
+    columns = {}
+    for name in df.columns:
+        values = df[name]
+        dtype = schema.get(name)
+        if dtype == "category":
+            columns[name] = values.astype("category")
+        elif dtype is not None and pd.api.types.is_numeric_dtype(values):
+            if np.dtype(dtype).kind == "u":
+                columns[name] = _downcast_integer(values, dtype) if len(values) else values.astype(dtype)
+            else:
+                columns[name] = values.astype(dtype)
+        elif pd.api.types.is_integer_dtype(values) and len(values):
+            columns[name] = pd.to_numeric(values, downcast="integer")
+        else:
+            columns[name] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def _open_workbook(source):
+    from openpyxl import load_workbook
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    # 只读模式按需解析工作表 XML，不会把整个工作簿载入内存
+    return load_workbook(source, read_only=True, data_only=True)
+
+
+def excel_sheets(source):
+    """Excel 工作簿中的工作表名称"""
+    workbook = _open_workbook(source)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def _iter_excel_chunks(source, schema, wanted, chunksize, sheet=None):
+    # 第一行为列名，其余各行每 chunksize 行组成一块，按列推断类型后再应用列类型
+    workbook = _open_workbook(source)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = [f"列{i + 1}" if name is None else str(name).strip() for i, name in enumerate(header)]
+        while names and header[len(names) - 1] is None:
+            # 去掉末尾没有列名的空列
+            names.pop()
+        width = len(names)
+        selected = [i for i, name in enumerate(names) if wanted is None or name in wanted]
+        start = 0
+        while True:
+            block = list(itertools.islice(rows, chunksize))
+            if not block:
+                return
+            # 只读模式下各行的长度可能与表头不同，补齐或截断后再按列转置；全空的行跳过
+            batch = [(tuple(row) + (None,) * width)[:width] if len(row) != width else row
+                     for row in block if any(value is not None for value in row)]
+            if not batch:
+                continue
+            columns = list(zip(*batch))
+            chunk = pd.DataFrame({names[i]: pd.Series(columns[i], dtype=object).infer_objects() for i in selected})
+            chunk.index = pd.RangeIndex(start, start + len(batch))
+            start += len(batch)
+            yield apply_schema(chunk, schema)
+    finally:
+        workbook.close()
+
+
+def read_table(data, filename, schema, sheet=None):
+    """读取完整的上传文件 (bytes) 并应用列类型，sheet 为 Excel 工作表名称 (缺省时为第一个工作表)"""
+    fmt = table_format(filename)
+    if fmt == "xlsx":
+        chunks = list(_iter_excel_chunks(data, schema, None, DEFAULT_CHUNKSIZE, sheet))
+        if not chunks:
+            return pd.DataFrame()
+        # 各块的分类列类别可能不同，合并后重新应用列类型
+        return apply_schema(pd.concat(chunks, ignore_index=True), schema)
+    if fmt == "parquet":
+        df = pd.read_parquet(io.BytesIO(data))
+    elif fmt == "arrow":
+        df = pd.read_feather(io.BytesIO(data))
+    else:
+        # pyarrow 引擎多线程解析CSV
+        df = pd.read_csv(io.BytesIO(data), engine="pyarrow")
+    return apply_schema(df, schema)
+
+
+def iter_table_chunks(source, filename, schema, columns=None, chunksize=DEFAULT_CHUNKSIZE, encoding=None,
+                      sheet=None):
+    """按块读取文件，source 可以是文件路径或文件内容 (bytes)，columns 为空时读取全部列"""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    wanted = None if columns is None else set(columns)
+    fmt = table_format(filename)
+
+    if fmt == "xlsx":
+        yield from _iter_excel_chunks(source, schema, wanted, chunksize, sheet)
+    elif fmt == "parquet":
+        parquet_file = pq.ParquetFile(source)
+        names = parquet_file.schema_arrow.names
+        selected = names if wanted is None else [name for name in names if name in wanted]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=selected):
+            yield apply_schema(batch.to_pandas(), schema)
+    elif fmt == "arrow":
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if wanted is not None:
+                batch = batch.select([name for name in batch.schema.names if name in wanted])
+            # Feather 文件的记录批次可能很大，再按 chunksize 切分
+            for start in range(0, batch.num_rows, chunksize):
+                yield apply_schema(batch.slice(start, chunksize).to_pandas(), schema)
+    else:
+        usecols = None if wanted is None else (lambda column: column in wanted)
+        for chunk in pd.read_csv(source, chunksize=chunksize, usecols=usecols, encoding=encoding):
+            yield apply_schema(chunk, schema)
@@ -0,0 +1,240 @@
+"""选址评分引擎
+
+单店评估与多店对比共用的评分公式。所有维度得分函数既接受标量（单店表单），
+也接受 NumPy 数组（整列批量计算），保证两条路径的结果完全一致。
+"""
+import numpy as np
+import pandas as pd
+
+# 六个评估维度 (顺序与侧边栏权重、得分矩阵的列一一对应)
+CATEGORIES = ['人流量', '租金成本', '竞争情况', '周边配套', '交通便利性', '客群匹配度']
+SCORE_COLUMNS = ["人流量得分", "租金成本得分", "竞争情况得分",
+                 "周边配套得分", "交通便利性得分", "目标客群匹配度得分"]
+
+# 侧边栏默认权重
+DEFAULT_WEIGHTS = (0.3, 0.2, 0.15, 0.15, 0.1, 0.1)
+
+# 根据城市等级设置不同的租金评分标准 (元/平方米)
+CITY_RENT_STANDARDS = {
+    "一线城市": 500,
+    "二线城市": 300,
+    "三线城市": 200,
+    "四线及以下城市": 100
+}
+DEFAULT_RENT_STANDARD = 200
+
+# 商圈类型
+DISTRICT_TYPES = ["核心商圈", "区域商圈", "社区商圈", "特色商圈"]
+
+# 全年工作日、周末、节假日天数，用于人流量加权
+DAY_MIX = (250, 104, 11)
+
+# 多店对比CSV的必要列
+REQUIRED_COLUMNS = ["位置名称", "城市等级", "商圈类型", "店铺面积", "月租金",
+                    "早高峰人流量", "午高峰人流量", "晚高峰人流量", "周末人流量",
+                    "节假日人流量", "竞争对手数量", "最近竞争对手距离", "市场饱和度",
+                    "竞争优势评估", "交通便利性", "周边配套完善度"]
+
+# 可选列及缺省值 (与单店评估表单的默认值一致)
+OPTIONAL_COLUMNS = {
+    "停车位数量": 50,
+    "公交地铁站数量": 3,
+    "周边住宅密度": 6,
+    "周边商业密度": 7,
+    "目标人群匹配度": 8,
+    "年龄结构匹配度": 7,
+    "收入水平匹配度": 6,
+    "消费习惯匹配度": 7
+}
+
+# 参与评分的数值输入列 (城市等级另行换算为标准租金)
+INPUT_COLUMNS = ["店铺面积", "月租金", "早高峰人流量", "午高峰人流量", "晚高峰人流量",
+                 "周末人流量", "节假日人流量", "竞争对手数量", "最近竞争对手距离", "市场饱和度",
+                 "竞争优势评估", "交通便利性", "周边配套完善度"] + list(OPTIONAL_COLUMNS)
+
+# 优劣势判定阈值及标签 (只针对前五个维度)
+STRENGTH_THRESHOLD = 80
+WEAKNESS_THRESHOLD = 60
+STRENGTH_LABELS = ["人流量充足", "租金成本合理", "竞争压力小", "周边配套完善", "交通便利"]
+WEAKNESS_LABELS = ["人流量不足", "租金成本较高", "竞争压力大", "周边配套不足", "交通不便"]
+
+
+def avg_daily_traffic(morning, afternoon, evening):
+    """平均人流量 (晚高峰双倍计权)"""
+    return (morning + afternoon + evening * 2) / 4
+
+
+def blended_traffic(morning, afternoon, evening, weekend, holiday):
+    """按全年工作日、周末、节假日天数加权的平均人流量 (工作日取高峰加权平均)"""
+    weekday_days, weekend_days, holiday_days = DAY_MIX
+    weekday = avg_daily_traffic(morning, afternoon, evening)
+    return (weekday * weekday_days + weekend * weekend_days + holiday * holiday_days) / sum(DAY_MIX)
+
+
+def foot_traffic_score(morning, afternoon, evening, weekend=None, holiday=None):
+    # 人流量越高越好，转换为0-100分；提供周末、节假日人流量时按全年天数加权
+    if weekend is None or holiday is None:
+        traffic = avg_daily_traffic(morning, afternoon, evening)
+    else:
+        traffic = blended_traffic(morning, afternoon, evening, weekend, holiday)
+    return np.minimum(100, traffic / 100)
+
+
+def rent_score(rent_cost, area_size, standard_rent):
+    # 每平米租金相对城市标准越低越好
+    rent_per_sqm = rent_cost / area_size
+    score = 100 - ((rent_per_sqm - standard_rent) / standard_rent) * 100
+    return np.clip(score, 0, 100)
+
+
+def competition_score(competitor_count, competitor_distance, market_saturation, competitive_advantage):
+    # 竞争对手越少、距离越远、市场饱和度越低、竞争优势越高越好
+    score = (
+        (10 - competitor_count) * 5 +  # 竞争对手数量 (反向计分)
+        np.minimum(100, competitor_distance / 10) * 0.2 +  # 最近竞争对手距离
+        (100 - market_saturation) * 0.3 +  # 市场饱和度 (反向计分)
+        competitive_advantage * 0.2  # 竞争优势
+    )
+    return np.minimum(100, score)
+
+
+def amenities_score(amenities, residential_density, commercial_density):
+    # 0-10分的输入按 50% / 25% / 25% 折算为0-100分
+    score = (
+        amenities * 5 +  # 周边配套完善度
+        residential_density * 2.5 +  # 周边住宅密度
+        commercial_density * 2.5  # 周边商业密度
+    )
+    return np.minimum(100, score)
+
+
+def transportation_score(transportation, parking_spots, public_transit_count):
+    score = (
+        transportation * 7 +  # 交通便利性
+        np.minimum(100, parking_spots) * 0.2 +  # 附近停车位数量
+        public_transit_count * 5  # 附近公交/地铁站数量
+    )
+    return np.minimum(100, score)
+
+
+def target_match_score(demographic, age_group, income_level, consumer_behavior):
+    # 四项0-10分的匹配度各占25%
+    score = (demographic + age_group + income_level + consumer_behavior) * 2.5
+    return np.minimum(100, score)
+
+
+def city_rent_standard(city_level):
+    """城市等级对应的标准租金，未知等级按默认标准处理"""
+    if isinstance(city_level, str):
+        return CITY_RENT_STANDARDS.get(city_level, DEFAULT_RENT_STANDARD)
+    city_level = pd.Series(city_level)
+    if isinstance(city_level.dtype, pd.CategoricalDtype):
+        # 分类列只需换算各个类别，再按编码取值 (编码-1表示缺失)
+        lookup = np.array([CITY_RENT_STANDARDS.get(level, DEFAULT_RENT_STANDARD)
+                           for level in city_level.cat.categories] + [DEFAULT_RENT_STANDARD], dtype=np.float64)
+        return lookup[city_level.cat.codes.to_numpy()]
+    return city_level.map(CITY_RENT_STANDARDS).fillna(DEFAULT_RENT_STANDARD).to_numpy(dtype=np.float64)
+
+
+def count_labels(codes):
+    """统计位掩码中的标签数量"""
+    table = np.array([bin(code).count("1") for code in range(1 << len(STRENGTH_LABELS))], dtype=np.uint8)
+    return table[codes]
+
+
+def strengths_report(names, matrix, overall):
+    """全部位置按综合评分排名的优劣势表，编码列可用于按标签筛选"""
+    order = rank_top_k(overall)
+    strengths, weaknesses = classify_strengths(matrix[order])
+    return pd.DataFrame({
+        "排名": np.arange(1, len(order) + 1),
+        "位置名称": np.asarray(names)[order],
+        "综合评分": overall[order],
+        "优势": describe_codes(strengths, STRENGTH_LABELS),
+        "劣势": describe_codes(weaknesses, WEAKNESS_LABELS),
+        "优势数量": count_labels(strengths),
+        "劣势数量": count_labels(weaknesses),
+        "优势编码": strengths,
+        "劣势编码": weaknesses,
+    }, index=order)
+
+
+def normalize_weights(weights):
+    """将权重归一化为总和为1的数组"""
+    weights = np.asarray(weights, dtype=np.float64)
+    return weights / weights.sum()
+
+
+def _column(df, name):
+    # 取出一列数值，缺失的可选列用表单默认值填充
+    if name in df.columns:
+        values = df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        if name in OPTIONAL_COLUMNS:
+            values = np.where(np.isnan(values), OPTIONAL_COLUMNS[name], values)
+        return values
+    return np.full(len(df), OPTIONAL_COLUMNS[name], dtype=np.float64)
+
+
+def dimension_scores(column, standard_rent, out):
+    """根据 column(列名) 取得的数值列计算六个维度得分，写入 out (N×6)"""
+    out[:, 0] = foot_traffic_score(column("早高峰人流量"), column("午高峰人流量"), column("晚高峰人流量"),
+                                   column("周末人流量"), column("节假日人流量"))
+    out[:, 1] = rent_score(column("月租金"), column("店铺面积"), standard_rent)
+    out[:, 2] = competition_score(
+        column("竞争对手数量"), column("最近竞争对手距离"), column("市场饱和度"), column("竞争优势评估"))
+    out[:, 3] = amenities_score(column("周边配套完善度"), column("周边住宅密度"), column("周边商业密度"))
+    out[:, 4] = transportation_score(column("交通便利性"), column("停车位数量"), column("公交地铁站数量"))
+    out[:, 5] = target_match_score(
+        column("目标人群匹配度"), column("年龄结构匹配度"), column("收入水平匹配度"), column("消费习惯匹配度"))
+    return out
+
+
+def compute_dimension_scores(df):
+    """按整列计算六个维度得分，返回 N×6 的 float64 矩阵"""
+    matrix = np.empty((len(df), len(SCORE_COLUMNS)), dtype=np.float64)
+    return dimension_scores(lambda name: _column(df, name), city_rent_standard(df["城市等级"]), matrix)
+
+
+def classify_strengths(matrix):
+    """将每个位置的优势/劣势维度编码为位掩码 (第 j 位对应第 j 个维度)"""
+    bits = (1 << np.arange(len(STRENGTH_LABELS))).astype(np.uint8)
+    dims = matrix[:, :len(STRENGTH_LABELS)]
+    strengths = (dims > STRENGTH_THRESHOLD) @ bits
+    weaknesses = (dims < WEAKNESS_THRESHOLD) @ bits
+    return strengths.astype(np.uint8), weaknesses.astype(np.uint8)
+
+
+def describe_codes(codes, labels):
+    """把位掩码批量转换为以逗号分隔的标签文字"""
+    table = np.array([", ".join(label for j, label in enumerate(labels) if code >> j & 1)
+                      for code in range(1 << len(labels))], dtype=object)
+    return table[codes]
+
+
+def weighted_scores(matrix, weights):
+    """得分矩阵与权重向量相乘得到综合评分"""
+    return matrix @ normalize_weights(weights)
+
+
+def rank_top_k(overall, k=None):
+    """返回综合评分最高的 k 个位置的下标 (降序)，k 为空时返回全部排名"""
+    n = len(overall)
+    if k is None or k >= n:
+        return np.argsort(-overall, kind="stable")
+    candidates = np.argpartition(-overall, k - 1)[:k]
+    return candidates[np.argsort(-overall[candidates], kind="stable")]
+
+
+def scores_frame(names, matrix, overall, index):
+    """按给定下标组装评分结果表"""
+    scores_df = pd.DataFrame(matrix[index], columns=SCORE_COLUMNS, index=index)
+    scores_df.insert(0, "综合评分", overall[index])
+    scores_df.insert(0, "位置名称", np.asarray(names)[index])
+    return scores_df
+
+
+def score_dataframe(df, weights, k=None):
+    """计算每个位置的综合评分与各维度得分，按综合评分降序排列"""
+    matrix = compute_dimension_scores(df)
+    overall = weighted_scores(matrix, weights)
+    return scores_frame(df["位置名称"].to_numpy(), matrix, overall, rank_top_k(overall, k))
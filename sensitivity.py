@@ -0,0 +1,78 @@
+"""权重敏感性分析
+
+侧边栏的六个权重是主观判断。在当前权重附近按 Dirichlet 分布抽取大量权重向量，
+把所有候选位置在全部权重下的综合评分作为一次矩阵乘法 (N×6 @ 6×S) 计算，
+统计每个位置排名第一和进入前K名的概率。按权重样本分块计算，
+每块的评分矩阵不超过给定的内存上限，十万个位置 × 一万组权重也只占用固定内存。
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_SAMPLES = 2000
+# 浓度越大，抽样的权重越集中在当前权重附近
+DEFAULT_CONCENTRATION = 100
+MEMORY_BUDGET = 64 * 1024 * 1024  # 字节
+
+
+def sample_weights(weights, n_samples=DEFAULT_SAMPLES, concentration=DEFAULT_CONCENTRATION, seed=42):
+    """以当前权重为均值抽取 S×6 的权重样本 (每行之和为1)"""
+    weights = np.asarray(weights, dtype=np.float64)
+    alpha = weights / weights.sum() * concentration
+    return np.random.default_rng(seed).dirichlet(alpha, size=n_samples)
+
+
+def _block_size(n_sites, bytes_per_element, memory_budget):
+    return max(1, memory_budget // (n_sites * bytes_per_element))
+
+
+def _candidates(matrix, weight_samples, k, memory_budget):
+    # 在当前权重下排名前k的位置给出每组权重下第k名评分的下界，
+    # 在任何一组权重下都达不到下界的位置不可能进入前k名，无需参与排序
+    seed = np.argpartition(matrix @ weight_samples.mean(axis=0), len(matrix) - k)[len(matrix) - k:]
+    lower_bound = (weight_samples @ matrix[seed].T).min(axis=1)
+    keep = np.zeros(len(matrix), dtype=bool)
+    block = _block_size(len(matrix), matrix.itemsize + 1, memory_budget)
+    for start in range(0, len(weight_samples), block):
+        scores = weight_samples[start:start + block] @ matrix.T
+        keep |= (scores >= lower_bound[start:start + block, None]).any(axis=0)
+    return np.flatnonzero(keep)
+
+
+def rank_probabilities(matrix, weight_samples, k=10, memory_budget=MEMORY_BUDGET):
+    """每个位置在抽样权重下排名第一和进入前k名的概率"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    weight_samples = np.asarray(weight_samples, dtype=np.float32)
+    n_sites, n_samples = len(matrix), len(weight_samples)
+    k = min(k, n_sites)
+    first_probability = np.zeros(n_sites)
+    top_probability = np.zeros(n_sites)
+    if n_sites == 0 or n_samples == 0:
+        return first_probability, top_probability
+
+    candidates = _candidates(matrix, weight_samples, k, memory_budget)
+    matrix = matrix[candidates]
+    n_candidates = len(candidates)
+    first_counts = np.zeros(n_candidates, dtype=np.int64)
+    top_counts = np.zeros(n_candidates, dtype=np.int64)
+    # 每块为 块大小×N 的评分矩阵，另需同样大小的分区副本和布尔掩码
+    block = _block_size(n_candidates, 2 * matrix.itemsize + 1, memory_budget)
+    for start in range(0, n_samples, block):
+        scores = weight_samples[start:start + block] @ matrix.T
+        first_counts += np.bincount(scores.argmax(axis=1), minlength=n_candidates)
+        # 每组权重下第k高的评分作为阈值，不低于阈值的位置进入前k名
+        threshold = np.partition(scores, n_candidates - k, axis=1)[:, n_candidates - k]
+        top_counts += (scores >= threshold[:, None]).sum(axis=0)
+    first_probability[candidates] = first_counts / n_samples
+    top_probability[candidates] = top_counts / n_samples
+    return first_probability, top_probability
+
+
+def sensitivity_frame(names, overall, first_probability, top_probability, limit=100):
+    """按进入前K名概率排序的稳定性表，只保留概率最高的 limit 个位置"""
+    order = np.lexsort((-np.asarray(overall), -first_probability, -top_probability))[:limit]
+    return pd.DataFrame({
+        "位置名称": np.asarray(names)[order],
+        "当前综合评分": np.asarray(overall)[order],
+        "排名第一概率": first_probability[order],
+        "进入前K名概率": top_probability[order],
+    })
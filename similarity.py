@@ -0,0 +1,72 @@
+"""相似位置搜索
+
+在聚类分析使用的 MinMax 标准化特征空间中查找与新位置最相似的历史位置。
+支持两种搜索方式：
+- 精确搜索：计算与全部历史位置的距离
+- 近似搜索：以 KMeans 聚类中心作为粗分桶 (倒排列表)，只在距离查询点最近的若干个聚类内精确比较
+"""
+import numpy as np
+
+DEFAULT_TOP_K = 5
+DEFAULT_PROBES = 2
+SEARCH_MODES = {"精确搜索": "exact", "近似搜索 (按聚类分桶)": "ivf"}
+
+
+def _nearest(vectors, norms, query, k):
+    # ||x - q||² = ||x||² - 2x·q + ||q||²，取最小的 k 个
+    distances = norms - 2 * (vectors @ query) + query @ query
+    k = min(k, len(distances))
+    nearest = np.argpartition(distances, k - 1)[:k]
+    nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+    return nearest, np.sqrt(np.maximum(distances[nearest], 0))
+
+
+class SiteIndex:
+    """历史位置的标准化特征向量索引，向量按聚类排序存放，每个聚类是一段连续的倒排列表"""
+
+    def __init__(self, model, sites, labels):
+        self.model = model
+        self.sites = sites.reset_index(drop=True)
+        labels = np.asarray(labels)
+        self.order = np.argsort(labels, kind="stable")
+        self.vectors = np.ascontiguousarray(model.transform(self.sites)[self.order], dtype=np.float32)
+        self.norms = (self.vectors.astype(np.float64) ** 2).sum(axis=1)
+        counts = np.bincount(labels, minlength=model.n_clusters)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    @property
+    def features(self):
+        return self.model.features
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, values, k=DEFAULT_TOP_K, mode="exact", n_probe=DEFAULT_PROBES):
+        """values 为特征名到取值的映射，返回最相似的 k 个历史位置的行号 (sites 中) 及标准化空间中的距离"""
+        query = np.array([values[name] for name in self.features], dtype=np.float64) * self.model.scale
+        query = (query + self.model.offset).astype(np.float32)
+        if mode == "exact" or n_probe >= self.model.n_clusters:
+            nearest, distances = _nearest(self.vectors, self.norms, query, k)
+            return self.order[nearest], distances
+
+        # 只在最近的 n_probe 个聚类内搜索
+        nonempty = np.flatnonzero(np.diff(self.offsets))
+        centroid_distances = ((self.model.centroids[nonempty] - query) ** 2).sum(axis=1)
+        probes = nonempty[np.argsort(centroid_distances)[:n_probe]]
+        # 每个聚类的向量连续存放，直接在切片上计算，再合并各聚类的前k名
+        found, found_distances = [], []
+        for cluster in probes:
+            start, stop = self.offsets[cluster], self.offsets[cluster + 1]
+            nearest, distances = _nearest(self.vectors[start:stop], self.norms[start:stop], query, k)
+            found.append(nearest + start)
+            found_distances.append(distances)
+        found, found_distances = np.concatenate(found), np.concatenate(found_distances)
+        best = np.argsort(found_distances, kind="stable")[:k]
+        return self.order[found[best]], found_distances[best]
+
+    def similar_sites(self, values, k=DEFAULT_TOP_K, mode="exact", n_probe=DEFAULT_PROBES):
+        """最相似的 k 个历史位置 (含全部原始列) 及其距离"""
+        rows, distances = self.search(values, k, mode, n_probe)
+        similar_df = self.sites.iloc[rows].copy()
+        similar_df.insert(0, "相似度距离", distances)
+        return similar_df
@@ -0,0 +1,121 @@
+"""空间索引
+
+把经纬度转换为单位球面上的三维坐标后建立 KD 树。球面弦长与大圆距离单调对应，
+因此半径查询和最近邻查询在全国范围内都是精确的，不受平面投影变形影响。
+"""
+import numpy as np
+
+EARTH_RADIUS = 6_371_000  # 米
+DEFAULT_COMPETITOR_RADIUS = 500  # 米
+QUERY_CHUNKSIZE = 50_000
+
+
+def to_unit_xyz(lat, lon):
+    """经纬度 (度) 转换为单位球面坐标，返回 N×3 数组"""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def meters_to_chord(meters):
+    return 2 * np.sin(np.asarray(meters, dtype=np.float64) / (2 * EARTH_RADIUS))
+
+
+def chord_to_meters(chord):
+    return 2 * EARTH_RADIUS * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+class PointIndex:
+    """点位 (如竞争对手、POI) 的空间索引，查询按块进行以控制内存
+
+    values 为每个点位附带的数值 (如人流量监测值、租金样本)，用于反距离加权插值。
+    """
+
+    def __init__(self, lat, lon, values=None, leaf_size=40):
+        # scikit-learn 导入较慢，建立索引时才导入
+        from sklearn.neighbors import KDTree
+
+        self.size = len(lat)
+        # 点位的经纬度范围 (纬度最小, 纬度最大, 经度最小, 经度最大)
+        self.bounds = (float(np.min(lat)), float(np.max(lat)), float(np.min(lon)), float(np.max(lon))) \
+            if self.size else None
+        self.values = None if values is None else np.asarray(values, dtype=np.float64)
+        self.tree = KDTree(to_unit_xyz(lat, lon), leaf_size=leaf_size)
+
+    def _chunks(self, lat, lon):
+        for start in range(0, len(lat), QUERY_CHUNKSIZE):
+            stop = start + QUERY_CHUNKSIZE
+            yield start, stop, to_unit_xyz(lat[start:stop], lon[start:stop])
+
+    def count_within(self, lat, lon, radius_m):
+        """每个查询点半径范围内的点数"""
+        lat, lon = np.asarray(lat), np.asarray(lon)
+        counts = np.zeros(len(lat), dtype=np.int64)
+        if self.size == 0:
+            return counts
+        chord = float(meters_to_chord(radius_m))
+        for start, stop, xyz in self._chunks(lat, lon):
+            counts[start:stop] = self.tree.query_radius(xyz, chord, count_only=True)
+        return counts
+
+    def nearest_distance(self, lat, lon):
+        """每个查询点到最近点的距离 (米)"""
+        lat, lon = np.asarray(lat), np.asarray(lon)
+        distances = np.full(len(lat), np.inf)
+        if self.size == 0:
+            return distances
+        for start, stop, xyz in self._chunks(lat, lon):
+            chord, _ = self.tree.query(xyz, k=1)
+            distances[start:stop] = chord_to_meters(chord[:, 0])
+        return distances
+
+    def interpolate(self, lat, lon, k=4):
+        """用最近 k 个点位的数值做反距离加权插值"""
+        lat, lon = np.asarray(lat), np.asarray(lon)
+        k = min(k, self.size)
+        result = np.empty(len(lat))
+        for start, stop, xyz in self._chunks(lat, lon):
+            chord, index = self.tree.query(xyz, k=k)
+            # 距离加1米，避免查询点与点位重合时除以零
+            weights = 1 / (chord_to_meters(chord) + 1)
+            result[start:stop] = (weights * self.values[index]).sum(axis=1) / weights.sum(axis=1)
+        return result
+
+    def neighbors_within(self, lat, lon, radius_m):
+        """每个查询点半径范围内的点下标及距离 (米)"""
+        lat, lon = np.asarray(lat), np.asarray(lon)
+        chord = float(meters_to_chord(radius_m))
+        indices, distances = [], []
+        for _, _, xyz in self._chunks(lat, lon):
+            ind, dist = self.tree.query_radius(xyz, chord, return_distance=True)
+            indices.extend(ind)
+            distances.extend(chord_to_meters(d) for d in dist)
+        return indices, distances
+
+
+def index_points(df, value_column=None):
+    """为包含纬度、经度列的点位表建立空间索引，可附带一列数值"""
+    values = None if value_column is None else df[value_column].to_numpy()
+    return PointIndex(df["纬度"].to_numpy(), df["经度"].to_numpy(), values)
+
+
+def competition_features(candidates, index, radius_m=DEFAULT_COMPETITOR_RADIUS):
+    """根据竞争对手点位索引计算每个候选位置的竞争对手数量和最近竞争对手距离
+
+    缺少经纬度的位置保留原有的两列取值 (没有这两列时为缺失值)。
+    """
+    lat = candidates["纬度"].to_numpy(dtype=np.float64, na_value=np.nan)
+    lon = candidates["经度"].to_numpy(dtype=np.float64, na_value=np.nan)
+    located = np.isfinite(lat) & np.isfinite(lon)
+    columns = {}
+    for name, compute in [("竞争对手数量", lambda: index.count_within(lat[located], lon[located], radius_m)),
+                          ("最近竞争对手距离", lambda: index.nearest_distance(lat[located], lon[located]))]:
+        if located.all():
+            columns[name] = compute()
+            continue
+        values = (candidates[name].to_numpy(dtype=np.float64, na_value=np.nan) if name in candidates.columns
+                  else np.full(len(candidates), np.nan))
+        values[located] = compute()
+        columns[name] = values
+    return candidates.assign(**columns)
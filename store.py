@@ -0,0 +1,191 @@
+"""评估结果本地存储
+
+把多店对比的评分结果 (输入数据、六个维度得分、综合评分) 和所用权重保存到嵌入式 SQLite 数据库。
+综合评分、城市等级、商圈类型和评估时间上建有索引，按条件筛选历史评估是索引查询，无需重新评分。
+写入按批提交事务，百万行级别的评估结果也能快速保存。
+"""
+import os
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import scoring
+
+# 设置该环境变量可指定数据库文件路径
+ENV_VARIABLE = "SITE_SELECTION_DB"
+DEFAULT_DB_PATH = "选址评估记录.db"
+BATCH_SIZE = 50_000
+DEFAULT_LIMIT = 1000
+
+WEIGHT_COLUMNS = [f"{category}权重" for category in scoring.CATEGORIES]
+# 评估表中保存的输入列 (纬度、经度可为空)
+STORED_INPUTS = scoring.INPUT_COLUMNS + ["纬度", "经度"]
+EVALUATION_COLUMNS = (["分析编号", "评估时间", "位置名称", "城市等级", "商圈类型", "综合评分"]
+                      + scoring.SCORE_COLUMNS + STORED_INPUTS)
+
+_REAL_COLUMNS = ["综合评分"] + scoring.SCORE_COLUMNS + STORED_INPUTS
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS analyses (
+    分析编号 INTEGER PRIMARY KEY,
+    创建时间 TEXT NOT NULL,
+    数据来源 TEXT,
+    位置数量 INTEGER NOT NULL,
+    {", ".join(f'"{name}" REAL' for name in WEIGHT_COLUMNS)}
+);
+CREATE TABLE IF NOT EXISTS evaluations (
+    评估编号 INTEGER PRIMARY KEY,
+    分析编号 INTEGER NOT NULL REFERENCES analyses(分析编号),
+    评估时间 TEXT NOT NULL,
+    位置名称 TEXT,
+    城市等级 TEXT,
+    商圈类型 TEXT,
+    {", ".join(f'"{name}" REAL' for name in _REAL_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS idx_evaluations_analysis ON evaluations(分析编号);
+CREATE INDEX IF NOT EXISTS idx_evaluations_score ON evaluations(综合评分);
+CREATE INDEX IF NOT EXISTS idx_evaluations_city ON evaluations(城市等级, 综合评分);
+CREATE INDEX IF NOT EXISTS idx_evaluations_district ON evaluations(商圈类型, 综合评分);
+CREATE INDEX IF NOT EXISTS idx_evaluations_time ON evaluations(评估时间);
+"""
+
+
+def _quote(name):
+    return f'"{name}"'
+
+
+def database_path():
+    """数据库文件路径，由环境变量 SITE_SELECTION_DB 设置 (默认为当前目录下的 选址评估记录.db)"""
+    return os.environ.get(ENV_VARIABLE) or DEFAULT_DB_PATH
+
+
+def database_exists(path=None):
+    """数据库文件是否已存在 (只查看历史记录时不必创建数据库)"""
+    return os.path.exists(path or database_path())
+
+
+def connect(path=None):
+    """打开数据库 (不存在时创建) 并确保表和索引存在，path 为空时使用 database_path()"""
+    conn = sqlite3.connect(path or database_path())
+    # WAL 模式下写入不阻塞读取
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # 较大的页缓存让批量写入时的索引更新留在内存中
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _column_values(df, name):
+    # 取出一列转换为 Python 列表，缺失值保存为 NULL
+    if name not in df.columns:
+        if name in scoring.OPTIONAL_COLUMNS:
+            return [float(scoring.OPTIONAL_COLUMNS[name])] * len(df)
+        return [None] * len(df)
+    values = df[name]
+    if pd.api.types.is_numeric_dtype(values):
+        values = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        missing = np.isnan(values)
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = None
+        return values.tolist()
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def save_analysis(conn, df, matrix, overall, weights, source=None, batch_size=BATCH_SIZE):
+    """保存一次多店对比的评分结果，返回分析编号"""
+    created = _now()
+    weights = scoring.normalize_weights(weights)
+    with conn:
+        cursor = conn.execute(
+            f"INSERT INTO analyses (创建时间, 数据来源, 位置数量, {', '.join(map(_quote, WEIGHT_COLUMNS))}) "
+            f"VALUES (?, ?, ?, {', '.join('?' * len(WEIGHT_COLUMNS))})",
+            [created, source, len(df), *map(float, weights)])
+    analysis_id = cursor.lastrowid
+
+    columns = {
+        "位置名称": _column_values(df, "位置名称"),
+        "城市等级": _column_values(df, "城市等级"),
+        "商圈类型": _column_values(df, "商圈类型"),
+        "综合评分": np.asarray(overall, dtype=np.float64).tolist(),
+    }
+    for j, name in enumerate(scoring.SCORE_COLUMNS):
+        columns[name] = matrix[:, j].tolist()
+    for name in STORED_INPUTS:
+        columns[name] = _column_values(df, name)
+
+    names = ["分析编号", "评估时间"] + list(columns)
+    sql = (f"INSERT INTO evaluations ({', '.join(map(_quote, names))}) "
+           f"VALUES ({', '.join('?' * len(names))})")
+    # 每批一个事务，避免逐行提交
+    for start in range(0, len(df), batch_size):
+        stop = start + batch_size
+        rows = zip([analysis_id] * (min(stop, len(df)) - start), [created] * (min(stop, len(df)) - start),
+                   *(values[start:stop] for values in columns.values()))
+        with conn:
+            conn.executemany(sql, rows)
+    return analysis_id
+
+
+def list_analyses(conn):
+    """全部已保存的分析，按创建时间倒序"""
+    return pd.read_sql_query("SELECT * FROM analyses ORDER BY 分析编号 DESC", conn)
+
+
+def _where(analysis_id=None, city_levels=None, districts=None, min_score=None, max_score=None,
+           since=None, until=None, name=None):
+    # 拼接筛选条件，返回 WHERE 子句和参数
+    clauses, params = [], []
+    if analysis_id is not None:
+        clauses.append("分析编号 = ?")
+        params.append(int(analysis_id))
+    for column, values in (("城市等级", city_levels), ("商圈类型", districts)):
+        if values:
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    if min_score is not None:
+        clauses.append("综合评分 >= ?")
+        params.append(float(min_score))
+    if max_score is not None:
+        clauses.append("综合评分 <= ?")
+        params.append(float(max_score))
+    if since is not None:
+        clauses.append("评估时间 >= ?")
+        params.append(str(since))
+    if until is not None:
+        clauses.append("评估时间 < ?")
+        params.append(str(until))
+    if name:
+        clauses.append("位置名称 LIKE ?")
+        params.append(f"%{name}%")
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+
+def query_evaluations(conn, limit=DEFAULT_LIMIT, offset=0, **filters):
+    """按条件筛选历史评估，按综合评分降序返回至多 limit 行
+
+    筛选条件: analysis_id, city_levels, districts, min_score, max_score, since, until (评估时间，
+    如 "2024-07-01")，name (位置名称包含的文字)。
+    """
+    where, params = _where(**filters)
+    sql = f"SELECT * FROM evaluations {where} ORDER BY 综合评分 DESC LIMIT ? OFFSET ?"
+    return pd.read_sql_query(sql, conn, params=params + [int(limit), int(offset)])
+
+
+def count_evaluations(conn, **filters):
+    """满足条件的历史评估数量 (筛选条件同 query_evaluations)"""
+    where, params = _where(**filters)
+    return conn.execute(f"SELECT COUNT(*) FROM evaluations {where}", params).fetchone()[0]
+
+
+def delete_analysis(conn, analysis_id):
+    """删除一次分析及其全部评估"""
+    with conn:
+        conn.execute("DELETE FROM evaluations WHERE 分析编号 = ?", (int(analysis_id),))
+        conn.execute("DELETE FROM analyses WHERE 分析编号 = ?", (int(analysis_id),))
@@ -0,0 +1,67 @@
+"""评分一致性测试
+
+单店评估表单 (逐项标量计算) 与多店对比批量评分 (整列计算) 对同一行数据的得分应一致，
+串行评分与多进程分片评分 (batch_score.py --workers N) 的得分、优劣势编码和排名应一致。
+"""
+import numpy as np
+import pytest
+
+import benchmark
+import parallel
+import schema
+import scoring
+
+N_ROWS = 2000
+SEED = 7
+
+
+@pytest.fixture(scope="module")
+def comparison_df():
+    # 按上传文件的列类型读取 (小范围整数压缩、城市等级与商圈类型为分类列)
+    return schema.apply_schema(benchmark.comparison_table(N_ROWS, SEED), schema.COMPARISON_SCHEMA)
+
+
+def _form_scores(row):
+    # 与单店评估表单相同的调用方式：标量输入逐项计算六个维度得分，缺少的可选列用表单默认值
+    value = {**scoring.OPTIONAL_COLUMNS, **{name: row[name].item() if hasattr(row[name], "item") else row[name]
+                                            for name in row.index}}
+    return [
+        scoring.foot_traffic_score(value["早高峰人流量"], value["午高峰人流量"], value["晚高峰人流量"],
+                                   value["周末人流量"], value["节假日人流量"]),
+        scoring.rent_score(value["月租金"], value["店铺面积"], scoring.city_rent_standard(value["城市等级"])),
+        scoring.competition_score(value["竞争对手数量"], value["最近竞争对手距离"], value["市场饱和度"],
+                                  value["竞争优势评估"]),
+        scoring.amenities_score(value["周边配套完善度"], value["周边住宅密度"], value["周边商业密度"]),
+        scoring.transportation_score(value["交通便利性"], value["停车位数量"], value["公交地铁站数量"]),
+        scoring.target_match_score(value["目标人群匹配度"], value["年龄结构匹配度"], value["收入水平匹配度"],
+                                   value["消费习惯匹配度"]),
+    ]
+
+
+@pytest.mark.parametrize("drop_optional", [False, True])
+def test_form_matches_batch(comparison_df, drop_optional):
+    df = comparison_df.drop(columns=list(scoring.OPTIONAL_COLUMNS)) if drop_optional else comparison_df
+    matrix = scoring.compute_dimension_scores(df)
+    overall = scoring.weighted_scores(matrix, scoring.DEFAULT_WEIGHTS)
+
+    rows = np.random.default_rng(SEED).choice(len(df), 50, replace=False)
+    for i in rows:
+        form = _form_scores(df.iloc[i])
+        form_overall = float(np.dot(form, scoring.normalize_weights(scoring.DEFAULT_WEIGHTS)))
+        np.testing.assert_allclose(form, matrix[i], rtol=1e-12, atol=1e-9)
+        assert form_overall == pytest.approx(overall[i], rel=1e-12, abs=1e-9)
+
+
+@pytest.mark.parametrize("workers, k", [(2, 100), (3, None)])
+def test_sharded_matches_serial(comparison_df, workers, k):
+    matrix = scoring.compute_dimension_scores(comparison_df)
+    overall = scoring.weighted_scores(matrix, scoring.DEFAULT_WEIGHTS)
+    strengths, weaknesses = scoring.classify_strengths(matrix)
+
+    sharded = parallel.score_parallel(comparison_df, scoring.DEFAULT_WEIGHTS, k, workers)
+    sharded_matrix, sharded_overall, sharded_strengths, sharded_weaknesses, top_index = sharded
+    np.testing.assert_allclose(sharded_matrix, matrix, rtol=1e-12, atol=1e-9)
+    np.testing.assert_allclose(sharded_overall, overall, rtol=1e-12, atol=1e-9)
+    np.testing.assert_array_equal(sharded_strengths, strengths)
+    np.testing.assert_array_equal(sharded_weaknesses, weaknesses)
+    np.testing.assert_array_equal(top_index, scoring.rank_top_k(overall, k))
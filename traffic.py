@@ -0,0 +1,165 @@
+"""逐小时人流量时序的聚合
+
+计数器产生长格式数据 (位置名称, 时间, 人流量)，按块读取后把每一行归入一个时段：
+工作日的早/午/晚高峰，以及周末、节假日的营业时间。每块按 (月份, 位置, 时段) 分组求和与计数，
+得到的部分聚合结果很小 (位置数 × 时段数)，可以按月份保存。新的一个月的数据到来时
+只需处理新数据，再与已保存的各月部分聚合合并，即可得到每个位置各时段的平均每小时人流量，
+直接填入多店对比数据的 早高峰人流量 ... 节假日人流量 列。
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import schema
+
+# 工作日高峰时段 [开始, 结束) 小时
+PEAK_HOURS = {
+    "早高峰人流量": (7, 9),
+    "午高峰人流量": (11, 13),
+    "晚高峰人流量": (17, 20),
+}
+# 周末、节假日按营业时间统计平均每小时人流量
+BUSINESS_HOURS = (10, 22)
+TRAFFIC_COLUMNS = list(PEAK_HOURS) + ["周末人流量", "节假日人流量"]
+
+# 长格式时序数据的列名与类型
+SITE_COLUMN = "位置名称"
+TIME_COLUMN = "时间"
+COUNT_COLUMN = "人流量"
+TIMESERIES_SCHEMA = {COUNT_COLUMN: "uint32"}
+
+PARTIAL_COLUMNS = ["月份", "位置名称", "时段", "合计", "小时数"]
+
+
+def parse_holidays(dates):
+    """把日期字符串 (如 2024-10-01) 转换为节假日集合"""
+    return pd.DatetimeIndex(pd.to_datetime([d for d in dates if str(d).strip()])).normalize().unique()
+
+
+def _time_slots(timestamps, holidays):
+    # 每行所属的时段下标 (对应 TRAFFIC_COLUMNS)，不属于任何时段为 -1
+    hour = timestamps.dt.hour.to_numpy()
+    day_of_week = timestamps.dt.dayofweek.to_numpy()
+    holiday = timestamps.dt.normalize().isin(holidays).to_numpy()
+    weekend = (day_of_week >= 5) & ~holiday
+    weekday = (day_of_week < 5) & ~holiday
+    business = (hour >= BUSINESS_HOURS[0]) & (hour < BUSINESS_HOURS[1])
+
+    slots = np.full(len(hour), -1, dtype=np.int8)
+    for j, (start, stop) in enumerate(PEAK_HOURS.values()):
+        slots[weekday & (hour >= start) & (hour < stop)] = j
+    slots[weekend & business] = len(PEAK_HOURS)
+    slots[holiday & business] = len(PEAK_HOURS) + 1
+    return slots
+
+
+def aggregate_chunk(chunk, holidays=()):
+    """一块时序数据按 (月份, 位置, 时段) 的部分聚合"""
+    # 空白或无法解析的时间记为 NaT，与缺失的人流量一起跳过
+    timestamps = pd.to_datetime(chunk[TIME_COLUMN], errors="coerce")
+    slots = _time_slots(timestamps, pd.DatetimeIndex(holidays))
+    counts = chunk[COUNT_COLUMN].to_numpy(dtype=np.float64, na_value=np.nan)
+    keep = (slots >= 0) & ~np.isnan(counts) & timestamps.notna().to_numpy()
+    # 有 NaT 时年月为浮点数，剔除后再转换为整数月份
+    months = (timestamps.dt.year * 100 + timestamps.dt.month).to_numpy()[keep].astype(np.int64)
+    grouped = pd.DataFrame({
+        "月份": months,
+        "位置名称": chunk[SITE_COLUMN].to_numpy()[keep],
+        "时段": slots[keep],
+        "人流量": counts[keep],
+    }).groupby(["月份", "位置名称", "时段"], sort=False)["人流量"].agg(["sum", "count"])
+    return grouped.set_axis(["合计", "小时数"], axis=1).reset_index()
+
+
+def combine_partials(partials):
+    """合并多份部分聚合 (同一键的合计与小时数相加)"""
+    partials = [partial for partial in partials if len(partial)]
+    if not partials:
+        return pd.DataFrame(columns=PARTIAL_COLUMNS)
+    combined = pd.concat(partials, ignore_index=True)
+    return combined.groupby(["月份", "位置名称", "时段"], sort=True)[["合计", "小时数"]].sum().reset_index()
+
+
+def aggregate_file(source, filename, holidays=(), chunksize=schema.DEFAULT_CHUNKSIZE, encoding=None):
+    """按块读取时序文件，返回部分聚合"""
+    columns = [SITE_COLUMN, TIME_COLUMN, COUNT_COLUMN]
+    reader = schema.iter_table_chunks(source, filename, TIMESERIES_SCHEMA, columns, chunksize, encoding)
+    # 每块的部分聚合都很小，累计到一定数量再合并一次
+    partials, result = [], []
+    for chunk in reader:
+        missing_columns = [col for col in columns if col not in chunk.columns]
+        if missing_columns:
+            raise ValueError(f"数据缺少必要的列: {', '.join(missing_columns)}")
+        partials.append(aggregate_chunk(chunk, holidays))
+        if len(partials) >= 32:
+            result = [combine_partials(result + partials)]
+            partials = []
+    return combine_partials(result + partials)
+
+
+def load_metrics(source, filename, holidays=(), chunksize=schema.DEFAULT_CHUNKSIZE):
+    """读取时序数据并计算人流量指标；文件不含时间列时视为已聚合的指标表直接读取"""
+    first = next(schema.iter_table_chunks(source, filename, TIMESERIES_SCHEMA, chunksize=1), None)
+    if first is not None and TIME_COLUMN in first.columns:
+        return traffic_metrics(aggregate_file(source, filename, holidays, chunksize))
+    metrics = schema.read_table(source, filename, {}).set_index(SITE_COLUMN)
+    missing_columns = [col for col in TRAFFIC_COLUMNS if col not in metrics.columns]
+    if missing_columns:
+        raise ValueError(f"人流量数据缺少必要的列: {', '.join(missing_columns)}")
+    return metrics[TRAFFIC_COLUMNS].astype(np.float64)
+
+
+def traffic_metrics(partials, months=None):
+    """由部分聚合计算每个位置各时段的平均每小时人流量，months 为空时使用全部月份
+
+    没有节假日数据的位置，节假日人流量按周末人流量计。
+    """
+    if months is not None:
+        partials = partials[partials["月份"].isin(months)]
+    totals = partials.groupby(["位置名称", "时段"])[["合计", "小时数"]].sum()
+    averages = (totals["合计"] / totals["小时数"]).unstack("时段")
+    averages = averages.reindex(columns=range(len(TRAFFIC_COLUMNS)))
+    averages.columns = TRAFFIC_COLUMNS
+    averages["节假日人流量"] = averages["节假日人流量"].fillna(averages["周末人流量"])
+    return averages
+
+
+def apply_metrics(df, metrics):
+    """用时序聚合结果覆盖多店对比数据中对应位置的人流量列 (无时序数据的位置保持原值)"""
+    matched = metrics.reindex(df["位置名称"].to_numpy())
+    columns = {}
+    for name in TRAFFIC_COLUMNS:
+        values = matched[name].to_numpy()
+        if name in df.columns:
+            values = np.where(np.isnan(values), df[name].to_numpy(dtype=np.float64, na_value=np.nan), values)
+        columns[name] = values
+    return df.assign(**columns)
+
+
+def _month_path(store, month):
+    return os.path.join(store, f"{month // 100:04d}-{month % 100:02d}.parquet")
+
+
+def save_partials(store, partials):
+    """按月份保存部分聚合，与已保存的同月结果合并 (跨月的上传文件各自补充到对应月份)，返回写入的月份
+
+    合计与小时数直接相加，同一份数据不要重复入库。
+    """
+    os.makedirs(store, exist_ok=True)
+    months = sorted(partials["月份"].unique())
+    for month in months:
+        path = _month_path(store, month)
+        month_partials = [partials[partials["月份"] == month]]
+        if os.path.exists(path):
+            month_partials.insert(0, pd.read_parquet(path))
+        combine_partials(month_partials).to_parquet(path, index=False)
+    return months
+
+
+def load_partials(store):
+    """读取已保存的全部月份的部分聚合"""
+    if not os.path.isdir(store):
+        return pd.DataFrame(columns=PARTIAL_COLUMNS)
+    files = sorted(name for name in os.listdir(store) if name.endswith(".parquet"))
+    return combine_partials([pd.read_parquet(os.path.join(store, name)) for name in files])
@@ -0,0 +1,61 @@
+"""逐小时人流量时序入库命令行工具
+
+按块读取长格式的人流量时序 (位置名称, 时间, 人流量)，按月份保存部分聚合，
+再与已保存的月份合并，输出每个位置的早/午/晚高峰、周末、节假日平均每小时人流量。
+每月只需处理当月新增的数据，之前月份的原始数据不必重新读取。
+
+用法示例:
+    python traffic_ingest.py 2024-06人流量.csv --store 人流量聚合 --holidays 节假日.txt -o 人流量指标.csv
+"""
+import argparse
+import sys
+import time
+
+import traffic
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="逐小时人流量时序聚合 (按月增量)")
+    parser.add_argument("inputs", nargs="*", help="新增的时序数据文件 (CSV/Parquet/Arrow)，可为空 (只重新输出指标)")
+    parser.add_argument("--store", required=True, help="保存各月部分聚合的目录")
+    parser.add_argument("--holidays", help="节假日日期文件，每行一个日期 (如 2024-10-01)")
+    parser.add_argument("--months", type=int, nargs="+", metavar="YYYYMM",
+                        help="只使用这些月份计算指标 (默认使用全部已保存月份)")
+    parser.add_argument("-o", "--output", help="人流量指标输出文件，缺省时输出到标准输出")
+    parser.add_argument("--chunksize", type=int, default=500_000, help="每块读取的行数 (默认500000)")
+    parser.add_argument("--encoding", default="utf-8-sig", help="输入输出文件编码 (默认utf-8-sig)")
+    return parser.parse_args(argv)
+
+
+def ingest(args, log=sys.stderr):
+    holidays = []
+    if args.holidays:
+        with open(args.holidays, encoding=args.encoding) as f:
+            holidays = traffic.parse_holidays(line.strip() for line in f)
+    for path in args.inputs:
+        start = time.perf_counter()
+        partials = traffic.aggregate_file(path, path, holidays, args.chunksize, args.encoding)
+        months = traffic.save_partials(args.store, partials)
+        print(f"{path}: 已聚合 {', '.join(str(month) for month in months) or '无数据'} "
+              f"({time.perf_counter() - start:.1f} 秒)", file=log)
+    return traffic.traffic_metrics(traffic.load_partials(args.store), args.months)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        metrics = ingest(args)
+    except (OSError, ValueError) as e:
+        print(f"数据处理出错: {e}", file=sys.stderr)
+        return 1
+
+    if args.output:
+        metrics.to_csv(args.output, encoding=args.encoding)
+    else:
+        metrics.to_csv(sys.stdout)
+    print(f"共输出 {len(metrics):,} 个位置的人流量指标", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
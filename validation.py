@@ -0,0 +1,184 @@
+"""上传数据校验
+
+按列整体检查类型、取值范围和枚举值 (城市等级、商圈类型)，不逐行循环。能修正的值直接修正
+(数字中的千分位逗号和空白、枚举值首尾空白)，无法修正的行移入隔离表供下载检查，其余行照常评分。
+只有出问题的少量行才会再生成逐行的问题说明。
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import schema
+import scoring
+
+
+@dataclass(frozen=True)
+class Rule:
+    """列校验规则：数值范围 [low, high] (low_inclusive 为 False 时要求大于 low) 或枚举取值"""
+    low: float = None
+    high: float = None
+    low_inclusive: bool = True
+    categories: tuple = None
+    # 缺失值是否视为错误 (可选列缺失时按表单默认值计算)
+    required: bool = True
+
+
+NUMBER_PATTERN = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+_COUNT = Rule(low=0)
+_RATING = Rule(low=0, high=10)
+_PERCENT = Rule(low=0, high=100)
+
+# 多店对比数据的校验规则
+COMPARISON_RULES = {
+    "城市等级": Rule(categories=tuple(scoring.CITY_RENT_STANDARDS)),
+    "商圈类型": Rule(categories=tuple(scoring.DISTRICT_TYPES)),
+    "店铺面积": Rule(low=0, low_inclusive=False),
+    "月租金": _COUNT,
+    "早高峰人流量": _COUNT,
+    "午高峰人流量": _COUNT,
+    "晚高峰人流量": _COUNT,
+    "周末人流量": _COUNT,
+    "节假日人流量": _COUNT,
+    "竞争对手数量": _COUNT,
+    "最近竞争对手距离": _COUNT,
+    "市场饱和度": _PERCENT,
+    "竞争优势评估": _PERCENT,
+    "交通便利性": _RATING,
+    "周边配套完善度": _RATING,
+    "停车位数量": Rule(low=0, required=False),
+    "公交地铁站数量": Rule(low=0, required=False),
+    **{name: Rule(low=0, high=10, required=False)
+       for name in ["周边住宅密度", "周边商业密度", "目标人群匹配度", "年龄结构匹配度", "收入水平匹配度", "消费习惯匹配度"]},
+    "纬度": Rule(low=-90, high=90, required=False),
+    "经度": Rule(low=-180, high=180, required=False),
+}
+
+# 聚类分析数据的校验规则 (所选特征另行要求不缺失)
+CLUSTERING_RULES = {
+    "人流量": Rule(low=0, required=False),
+    "每平米租金": Rule(low=0, required=False),
+    "竞争对手数量": Rule(low=0, required=False),
+    "交通便利性": Rule(low=0, high=10, required=False),
+}
+
+
+# 竞争对手/POI 及城市网格图层点位的校验规则 (所需的数值列另行要求不缺失)
+POI_RULES = {
+    "纬度": Rule(low=-90, high=90),
+    "经度": Rule(low=-180, high=180),
+    "人流量": Rule(low=0, required=False),
+    "每平米租金": Rule(low=0, required=False),
+}
+
+
+@dataclass
+class ValidationResult:
+    clean: pd.DataFrame
+    quarantine: pd.DataFrame
+    # 被修正 (如去掉千分位逗号) 的单元格数量
+    coerced: int
+
+
+def _coerce_numeric(values):
+    # 文本列去掉千分位逗号和空白后转换为数字，无法转换的记为缺失 (使用 Arrow 字符串计算，比逐个解析快)
+    try:
+        text = pa.array(values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # 数字与文本混合的列先统一转换为文本
+        text = pa.array(values.where(values.isna(), values.astype(str)), type=pa.string(), from_pandas=True)
+    cleaned = pc.utf8_trim_whitespace(pc.replace_substring(text, ",", ""))
+    valid = pc.match_substring_regex(cleaned, NUMBER_PATTERN)
+    numbers = pc.cast(pc.if_else(valid, cleaned, None), pa.float64())
+    fixed = pc.sum(pc.and_(valid, pc.not_equal(text, cleaned))).as_py() or 0
+    return pd.Series(numbers.to_numpy(zero_copy_only=False), index=values.index), fixed
+
+
+def _coerce_category(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # 只需处理类别本身，不必逐行处理；去掉空白后相同的类别合并
+        stripped = values.cat.categories.astype(str).str.strip()
+        categories = stripped.unique()
+        codes = values.cat.codes.to_numpy()
+        codes = np.where(codes >= 0, categories.get_indexer(stripped)[codes], -1)
+        return pd.Series(pd.Categorical.from_codes(codes, categories), index=values.index)
+    return values.where(values.isna(), values.astype(str).str.strip())
+
+
+def _coerce(df, rules, required):
+    # 返回修正后的各列及修正的单元格数量
+    columns, coerced = {}, 0
+    for name in df.columns:
+        rule = rules.get(name, Rule() if name in required else None)
+        values = df[name]
+        if rule is None:
+            continue
+        if rule.categories is not None:
+            columns[name] = _coerce_category(values)
+        elif not pd.api.types.is_numeric_dtype(values):
+            columns[name], fixed = _coerce_numeric(values)
+            coerced += fixed
+    return columns, coerced
+
+
+def _checks(df, rules, required):
+    # 逐条规则生成 (问题说明, 不合格行掩码)
+    for name in df.columns:
+        rule = rules.get(name, Rule() if name in required else None)
+        if rule is None:
+            continue
+        values = df[name]
+        is_required = rule.required or name in required
+        if rule.categories is not None:
+            invalid = ~values.isin(rule.categories).to_numpy()
+            if not is_required:
+                invalid &= values.notna().to_numpy()
+            yield f"{name}取值无效", invalid
+            continue
+        numbers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        missing = np.isnan(numbers)
+        if is_required:
+            yield f"{name}缺失或无法解析", missing
+        out_of_range = np.zeros(len(numbers), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            if rule.low is not None:
+                out_of_range |= numbers < rule.low if rule.low_inclusive else numbers <= rule.low
+            if rule.high is not None:
+                out_of_range |= numbers > rule.high
+        yield f"{name}超出范围", out_of_range
+
+
+def validate(df, rules, required=(), data_schema=None):
+    """校验数据，返回通过校验的行 (已修正并按 data_schema 重新压缩类型) 和隔离的问题行
+
+    rules 中没有、但在 required 中的列要求为不缺失的数值。隔离表保留原始取值，
+    并附加原始行号和问题说明。
+    """
+    required = set(required)
+    columns, coerced = _coerce(df, rules, required)
+    checked = df.assign(**columns) if columns else df
+
+    bad = np.zeros(len(df), dtype=bool)
+    for _, invalid in _checks(checked, rules, required):
+        bad |= invalid
+
+    if not bad.any():
+        clean = checked
+        quarantine = df.iloc[:0].assign(原始行号=pd.Series(dtype=np.int64), 问题=pd.Series(dtype=object))
+    else:
+        clean = checked[~bad]
+        # 只对隔离行生成问题说明
+        bad_rows = np.flatnonzero(bad)
+        reasons = np.full(len(bad_rows), "", dtype=object)
+        for message, invalid in _checks(checked.iloc[bad_rows], rules, required):
+            if invalid.any():
+                reasons[invalid] += message + "; "
+        quarantine = df.iloc[bad_rows].assign(原始行号=bad_rows + 1,
+                                              问题=pd.Series(reasons, dtype=object).str[:-2].to_numpy())
+    if data_schema is not None and columns:
+        # 只需重新压缩被修正过的列
+        clean = clean.assign(**schema.apply_schema(clean[list(columns)], data_schema))
+    return ValidationResult(clean, quarantine, coerced)